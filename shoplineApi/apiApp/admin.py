@@ -1,6 +1,19 @@
+import io
+import logging
+import time
+
 from django.contrib import admin
-from .models import Cart, CartItem, Category, CustomUser, Order, OrderItem, Product, ProductRating, Review, Wishlist, CustomerAddress
+from .models import Cart, CartItem, Category, CustomUser, Order, OrderItem, Product, ProductRating, RecommendationRun, Review, WebhookEvent, Wishlist, CustomerAddress
 from django.contrib.auth.admin import UserAdmin
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import path
+
+from .catalog_io import PRODUCT_FIELDS, ProductImporter, export_product_rows
+from .order_export import ORDER_FIELDS, export_order_rows
+from .streaming import CONTENT_TYPES, detect_format, encode_rows, read_rows
+
+logger = logging.getLogger("apiApp.catalog_io")
 
 # Register your models here.
 
@@ -9,8 +22,63 @@ class CustomUserAdmin(UserAdmin):
 admin.site.register(CustomUser, CustomUserAdmin)
 
 
+# La descarga termina después de devolver la respuesta: las filas/s se reportan
+# en el log al agotar el generador
+def timed_rows(rows, filename):
+    start = time.monotonic()
+    count = 0
+    for row in rows:
+        count += 1
+        yield row
+    elapsed = time.monotonic() - start
+    logger.info("%s: %d filas exportadas en %.2fs (%.0f filas/s)", filename, count, elapsed, count / max(elapsed, 1e-6))
+
+
+def export_response(rows, fields, fmt, filename):
+    response = StreamingHttpResponse(encode_rows(timed_rows(rows, filename), fields, fmt), content_type=CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
 class ProductAdmin(admin.ModelAdmin):
     list_display = ["name", "price", "featured"]
+    change_list_template = "admin/apiApp/product/change_list.html"
+    actions = ["export_csv", "export_jsonl"]
+
+    @admin.action(description="Exportar los productos seleccionados (CSV)")
+    def export_csv(self, request, queryset):
+        return export_response(export_product_rows(queryset), PRODUCT_FIELDS, "csv", "products")
+
+    @admin.action(description="Exportar los productos seleccionados (JSONL)")
+    def export_jsonl(self, request, queryset):
+        return export_response(export_product_rows(queryset), PRODUCT_FIELDS, "jsonl", "products")
+
+    def get_urls(self):
+        urls = [path("import/", self.admin_site.admin_view(self.import_view), name="apiApp_product_import")]
+        return urls + super().get_urls()
+
+    # Importa un CSV/JSONL subido; el archivo se lee por líneas sin cargarlo completo
+    def import_view(self, request):
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            return redirect("admin:apiApp_product_changelist")
+        upload = request.FILES.get("file")
+        if request.method == "POST" and upload:
+            fmt = detect_format(upload.name)
+            importer = ProductImporter()
+            try:
+                importer.run(read_rows(io.TextIOWrapper(upload.file, encoding="utf-8"), fmt))
+            except ValueError as error:
+                # Archivo mal formado: se informa la línea y lo importado hasta ahí
+                self.message_user(request, f"Importación interrumpida. {error}", level="error")
+            stats = importer.stats
+            for error in stats["errors"]:
+                self.message_user(request, error, level="warning")
+            self.message_user(request, f'{stats["rows"]} filas ({stats["rows_per_second"]:.0f} filas/s): '
+                                       f'{stats["created"]} creados, {stats["updated"]} actualizados, '
+                                       f'{stats["skipped"]} omitidos')
+            return redirect("admin:apiApp_product_changelist")
+        context = {**self.admin_site.each_context(request), "opts": self.model._meta, "title": "Importar productos"}
+        return render(request, "admin/apiApp/product/import.html", context)
 
 admin.site.register(Product, ProductAdmin)
 
@@ -47,5 +115,37 @@ class WishlistAdmin(admin.ModelAdmin):
 admin.site.register(Wishlist, WishlistAdmin)
 
 
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ("event_id", "event_type", "status", "attempts", "next_attempt_at", "created_at")
+    list_filter = ("status", "event_type")
+admin.site.register(WebhookEvent, WebhookEventAdmin)
+
+
+
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ("stripe_checkout_id", "customer_email", "amount", "currency", "status", "created_at")
+    list_filter = ("status",)
+    date_hierarchy = "created_at"
+    actions = ["export_csv"]
+
+    @admin.action(description="Exportar las líneas de las órdenes seleccionadas (CSV)")
+    def export_csv(self, request, queryset):
+        return export_response(export_order_rows(queryset), ORDER_FIELDS, "csv", "orders")
+admin.site.register(Order, OrderAdmin)
+
+
+class OrderItemAdmin(admin.ModelAdmin):
+    list_display = ("order", "product", "quantity")
+    list_select_related = ("order", "product")
+    raw_id_fields = ("order", "product")
+admin.site.register(OrderItem, OrderItemAdmin)
+
+
+class RecommendationRunAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "full", "products_updated", "elapsed", "last_order_item_id", "last_wishlist_id")
+    list_filter = ("full",)
+admin.site.register(RecommendationRun, RecommendationRunAdmin)
+
+
 
-admin.site.register([Order, OrderItem, CustomerAddress])
\ No newline at end of file
+admin.site.register([CustomerAddress])
\ No newline at end of file
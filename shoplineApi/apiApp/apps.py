@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apiApp'
+
+    def ready(self):
+        # Registra los receptores de señales (valoraciones de productos)
+        from . import signals  # noqa: F401
+
+        # Cronometra las consultas de cada conexión para el middleware de rendimiento
+        from . import instrumentation  # noqa: F401
@@ -0,0 +1,48 @@
+import json
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .models import Cart
+from .payments import async_stripe_client, checkout_items, checkout_session_params
+
+
+# Vistas asíncronas (ASGI, ver shoplineApi/asgi.py). Se ejecutan en el event
+# loop sin ocupar un hilo mientras esperan a la base de datos o a Stripe.
+#
+# Las vistas de lectura del catálogo y del carrito son síncronas. Se probaron
+# versiones asíncronas (manage.py loadtest: 1 CPU, SQLite, 30 productos, 4
+# workers, 32 clientes concurrentes, 4000 peticiones en 4 rutas) y fueron más
+# lentas que las síncronas, que además usan el caché de respuestas:
+#
+#   gunicorn, vistas síncronas:  131.5 req/s  p50 192 ms  p95  266 ms  p99  714 ms
+#   uvicorn, vistas asíncronas:   45.6 req/s  p50 365 ms  p95 2260 ms  p99 4525 ms
+#   uvicorn, vistas síncronas:    67.4 req/s  p50 262 ms  p95 1507 ms  p99 2314 ms
+#
+# El ORM asíncrono de Django ejecuta igualmente cada consulta en un hilo, así
+# que solo compensa donde se espera a un servicio externo (Stripe). Antes de
+# volver a intentarlo conviene repetir la prueba contra MySQL en producción.
+
+@csrf_exempt
+@require_POST
+async def create_checkout_session_async(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    cart_code = data.get("cart_code")
+    email = data.get("email")
+    try:
+        cart = await Cart.objects.aget(cart_code=cart_code)
+    except Cart.DoesNotExist:
+        return JsonResponse({'error': 'Cart not found.'}, status=404)
+
+    cartitems = [item async for item in checkout_items(cart)]
+    try:
+        params = checkout_session_params(cart_code, email, cartitems)
+        checkout_session = await async_stripe_client().checkout.sessions.create_async(params=params)
+        return JsonResponse({'data': checkout_session})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
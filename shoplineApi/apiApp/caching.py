@@ -0,0 +1,187 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+
+# Caché de respuestas del catálogo en dos niveles: un caché local del proceso
+# y el caché compartido ("default"). Las claves incluyen las versiones de las
+# que depende cada respuesta; las señales de los modelos incrementan esas
+# versiones, así invalidar no requiere borrar claves.
+
+CATALOG_VERSION = "catalog"  # productos y categorías (listados, similares)
+CATEGORIES_VERSION = "categories"  # estadísticas de las categorías (category_list)
+
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 0.05
+LOCK_RETRIES = 20
+
+# Parámetros propios de cada usuario que no cambian la respuesta cacheada
+# (las marcas de pertenencia se agregan después, ver membership.py)
+PERSONAL_PARAMS = ("email", "cart_code")
+
+
+def shared_cache():
+    return caches[settings.CATALOG_CACHE]
+
+
+def local_cache():
+    return caches[settings.CATALOG_LOCAL_CACHE]
+
+
+def product_version(slug):
+    return f"product:{slug}"
+
+
+# ----------------------- VERSIONES -----------------------
+
+def get_versions(names):
+    cache = shared_cache()
+    keys = [f"version:{name}" for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Una versión desconocida (o desalojada) se inicia con un valor
+            # único para no reutilizar entradas antiguas.
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+# Dentro de una transacción la versión se incrementa al confirmarla: si se
+# incrementara antes, otra petición podría recalcular la respuesta sin ver aún
+# los cambios y guardarla con la versión nueva. Fuera de una transacción
+# on_commit la ejecuta en el acto.
+def bump_version(name):
+    transaction.on_commit(lambda: increment_version(name))
+
+
+def increment_version(name):
+    cache = shared_cache()
+    key = f"version:{name}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION)
+
+
+def bump_product_version(slug):
+    bump_version(product_version(slug))
+
+
+def bump_categories_version():
+    bump_version(CATEGORIES_VERSION)
+
+
+# ----------------------- ESTADÍSTICAS -----------------------
+
+class CacheStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    def record(self, endpoint, hit):
+        with self.lock:
+            self.counters[endpoint]["hits" if hit else "misses"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {endpoint: dict(counter) for endpoint, counter in self.counters.items()}
+
+
+cache_stats = CacheStats()
+
+
+# ----------------------- RESPUESTAS -----------------------
+
+def get_or_compute(key, compute):
+    local, shared = local_cache(), shared_cache()
+
+    entry = local.get(key)
+    if entry is not None:
+        return entry, True
+    entry = shared.get(key)
+    if entry is not None:
+        local.set(key, entry, settings.CATALOG_LOCAL_CACHE_TIMEOUT)
+        return entry, True
+
+    # Protección contra estampidas: solo quien obtiene el candado calcula la
+    # respuesta; el resto espera brevemente a que aparezca en el caché.
+    lock_key = f"lock:{key}"
+    locked = shared.add(lock_key, 1, LOCK_TIMEOUT)
+    if not locked:
+        for _ in range(LOCK_RETRIES):
+            time.sleep(LOCK_WAIT)
+            entry = shared.get(key)
+            if entry is not None:
+                return entry, True
+
+    try:
+        entry = compute()
+        if entry is not None:
+            shared.set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+            local.set(key, entry, settings.CATALOG_LOCAL_CACHE_TIMEOUT)
+    finally:
+        if locked:
+            shared.delete(lock_key)
+    return entry, False
+
+
+# Copia de la petición sin los parámetros personales: la vista cacheada (y los
+# enlaces "next"/"previous" que arma el paginador) no debe ver datos de quien
+# la calculó primero, porque la respuesta se sirve a todos.
+def without_personal_params(request, params):
+    if params.urlencode() == request.GET.urlencode():
+        return request
+    django_request = copy.copy(request._request)
+    django_request.GET = params
+    django_request.META = {**django_request.META, "QUERY_STRING": params.urlencode()}
+    clean = copy.copy(request)
+    clean._request = django_request
+    return clean
+
+
+# Decorador para vistas de solo lectura del catálogo. `versions` recibe los
+# kwargs de la vista y devuelve los nombres de versión de los que depende la
+# respuesta. Solo se guardan las respuestas 200 (datos y cabeceras).
+def cache_catalog_response(endpoint, versions=lambda **kwargs: [CATALOG_VERSION]):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            version_values = get_versions(versions(**kwargs))
+            params = request.GET.copy()
+            for name in PERSONAL_PARAMS:
+                params.pop(name, None)
+            # La query se resume con un hash: memcached no acepta claves de más de 250 caracteres
+            query = hashlib.md5(params.urlencode().encode(), usedforsecurity=False).hexdigest()
+            key = ":".join(str(part) for part in ["response", endpoint, *kwargs.values(), *version_values, query])
+
+            uncached = {}
+
+            def compute():
+                response = view(without_personal_params(request, params), *args, **kwargs)
+                if response.status_code != 200:
+                    uncached["response"] = response
+                    return None
+                headers = {name: value for name, value in response.items() if name.lower() != "content-type"}
+                return {"data": response.data, "headers": headers}
+
+            entry, hit = get_or_compute(key, compute)
+            cache_stats.record(endpoint, hit)
+            if entry is None:
+                return uncached["response"]
+            return Response(entry["data"], headers=entry["headers"])
+        return wrapper
+    return decorator
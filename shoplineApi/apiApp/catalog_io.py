@@ -0,0 +1,186 @@
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.text import slugify
+
+from .caching import bump_catalog_version
+from .category_stats import refresh_category_stats
+from .models import Category, Product
+from .search import get_search_backend
+from .similarity import rebuild_all_similar_products, refresh_similar_products
+from .slugs import assign_slugs
+
+
+# Columnas de los archivos de importación/exportación del catálogo
+PRODUCT_FIELDS = ["slug", "name", "description", "price", "featured", "category", "image"]
+# Columnas que se actualizan al reimportar un producto existente, si vienen en
+# la fila (name y price son obligatorias)
+UPSERT_FIELDS = ["name", "description", "price", "featured", "category", "image"]
+IMAGE_DIR = "product_img"
+TRUE_VALUES = {"1", "true", "yes", "si", "sí", "y"}
+# Errores de fila que se guardan para el reporte (el resto solo se cuenta)
+MAX_REPORTED_ERRORS = 100
+
+
+class RowError(ValueError):
+    pass
+
+
+# ----------------------- IMPORTACIÓN -----------------------
+
+class ProductImporter:
+
+    def __init__(self, batch_size=1000, create_categories=True):
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        # Las categorías e imágenes disponibles se cargan una sola vez
+        self.categories = {}
+        for category in Category.objects.all():
+            self.categories[category.name.lower()] = category.id
+            self.categories[category.slug] = category.id
+        image_dir = os.path.join(settings.MEDIA_ROOT, IMAGE_DIR)
+        self.images = set(os.listdir(image_dir)) if os.path.isdir(image_dir) else set()
+        self.stats = {"rows": 0, "created": 0, "updated": 0, "skipped": 0, "errors": []}
+        # Los similares se recalculan por lote; si la importación llega a tocar
+        # la mitad del catálogo se pasa a un recálculo completo al terminar
+        self.catalog_size = 0
+        self.written = 0
+        self.rebuild_similar = False
+
+    def category_id(self, value):
+        value = (value or "").strip()
+        if not value:
+            return None
+        category_id = self.categories.get(value.lower()) or self.categories.get(slugify(value))
+        if category_id is None:
+            if not self.create_categories:
+                raise RowError(f'Categoría "{value}" no encontrada')
+            category = Category.objects.create(name=value)
+            category_id = self.categories[value.lower()] = self.categories[category.slug] = category.id
+        return category_id
+
+    def image(self, value):
+        filename = os.path.basename((value or "").strip())
+        if filename and filename in self.images:
+            return f"{IMAGE_DIR}/{filename}"
+        return ""
+
+    # Devuelve el producto y las columnas de UPSERT_FIELDS que trae la fila: las
+    # que faltan (o una imagen que no se encuentra) no pisan los valores guardados
+    def build_product(self, row):
+        name = (row.get("name") or "").strip()
+        if not name:
+            raise RowError("Falta el nombre")
+        try:
+            price = Decimal(str(row.get("price")).strip())
+        except (InvalidOperation, TypeError):
+            raise RowError(f'Precio inválido: {row.get("price")!r}')
+        featured = row.get("featured")
+        if not isinstance(featured, bool):
+            featured = str(featured or "").strip().lower() in TRUE_VALUES
+        product = Product(
+            name=name,
+            slug=slugify((row.get("slug") or "").strip()),
+            description=row.get("description") or "",
+            price=price,
+            featured=featured,
+            category_id=self.category_id(row.get("category")),
+            image=self.image(row.get("image")),
+        )
+        present = {"name", "price", *(field for field in ("description", "featured", "category") if field in row)}
+        if product.image:
+            present.add("image")
+        return product, tuple(field for field in UPSERT_FIELDS if field in present)
+
+    # Un archivo mal formado (ValueError de streaming.read_rows) corta la
+    # importación: los lotes ya escritos se conservan y se completan igual las
+    # estadísticas, los similares y la versión del catálogo; self.stats queda
+    # con lo importado hasta ese punto.
+    def run(self, rows):
+        start = time.monotonic()
+        self.catalog_size = Product.objects.count()
+        batch = {}
+        try:
+            for line, row in enumerate(rows, start=1):
+                self.stats["rows"] += 1
+                try:
+                    product, fields = self.build_product(row)
+                except RowError as error:
+                    self.stats["skipped"] += 1
+                    if len(self.stats["errors"]) < MAX_REPORTED_ERRORS:
+                        self.stats["errors"].append(f"Fila {line}: {error}")
+                    continue
+                # Dentro del lote, la última fila con el mismo slug gana
+                batch[product.slug or f"new:{line}"] = (product, fields)
+                if len(batch) >= self.batch_size:
+                    self.write_batch(list(batch.values()))
+                    batch = {}
+            if batch:
+                self.write_batch(list(batch.values()))
+        finally:
+            if self.stats["created"] or self.stats["updated"]:
+                refresh_category_stats()
+                if self.rebuild_similar:
+                    rebuild_all_similar_products()
+                bump_catalog_version()
+            self.stats["elapsed"] = time.monotonic() - start
+            self.stats["rows_per_second"] = self.stats["rows"] / max(self.stats["elapsed"], 1e-6)
+        return self.stats
+
+    # Inserta o actualiza (por slug) un lote con un INSERT ... ON CONFLICT / ON
+    # DUPLICATE KEY por cada combinación de columnas presentes (una sola si todas
+    # las filas traen las mismas)
+    def write_batch(self, entries):
+        products = [product for product, fields in entries]
+        with transaction.atomic():
+            slugs = [product.slug for product in products if product.slug]
+            existing = set(Product.objects.filter(slug__in=slugs).values_list("slug", flat=True))
+            assign_slugs(products)
+
+            groups = {}
+            for product, fields in entries:
+                groups.setdefault(fields, []).append(product)
+            for fields, group in groups.items():
+                kwargs = {"update_conflicts": True, "update_fields": list(fields)}
+                if connection.features.supports_update_conflicts_with_target:
+                    kwargs["unique_fields"] = ["slug"]
+                Product.objects.bulk_create(group, **kwargs)
+
+            # bulk_create no emite señales: se actualiza el índice de búsqueda
+            written = Product.objects.filter(slug__in=[p.slug for p in products])
+            get_search_backend().index_products(written)
+            written_ids = list(written.values_list("id", flat=True))
+
+        self.stats["updated"] += len(existing)
+        self.stats["created"] += len(products) - len(existing)
+        self.refresh_similar_products(written_ids)
+
+    # Tampoco se recalculan los productos similares por señal. Se actualizan
+    # por lote (sin acumular los ids de toda la importación) hasta que la
+    # importación toca la mitad del catálogo: desde ahí un recálculo completo
+    # al terminar (una pasada) es más barato que el incremental.
+    def refresh_similar_products(self, product_ids):
+        self.written += len(product_ids)
+        if self.rebuild_similar:
+            return
+        if self.written * 2 >= self.catalog_size + self.stats["created"]:
+            self.rebuild_similar = True
+        else:
+            refresh_similar_products(product_ids)
+
+
+# ----------------------- EXPORTACIÓN -----------------------
+
+# Filas del catálogo leídas en bloques con un cursor del servidor (iterator)
+def export_product_rows(queryset=None, chunk_size=2000):
+    queryset = Product.objects.all() if queryset is None else queryset
+    rows = (queryset.order_by("id")
+            .values("slug", "name", "description", "price", "featured", "category__name", "image")
+            .iterator(chunk_size=chunk_size))
+    for row in rows:
+        row["category"] = row.pop("category__name") or ""
+        row["image"] = os.path.basename(row["image"] or "")
+        yield row
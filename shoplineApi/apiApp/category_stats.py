@@ -0,0 +1,55 @@
+from django.db import connection
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .caching import bump_categories_version
+from .models import Category, CategoryStats, Product
+
+
+STATS_FIELDS = ["product_count", "featured_count", "min_price", "max_price", "total_reviews", "rating_sum"]
+EMPTY_STATS = {"product_count": 0, "featured_count": 0, "min_price": None, "max_price": None,
+               "total_reviews": 0, "rating_sum": 0}
+
+
+# Un único GROUP BY sobre los productos (con su valoración): categoría -> agregados
+def category_aggregates(category_ids=None):
+    products = Product.objects.filter(category__isnull=False)
+    if category_ids is not None:
+        products = products.filter(category_id__in=category_ids)
+    rows = (products.order_by().values("category_id")
+            .annotate(product_count=Count("id"),
+                      featured_count=Count("id", filter=Q(featured=True)),
+                      min_price=Min("price"),
+                      max_price=Max("price"),
+                      total_reviews=Coalesce(Sum("rating__total_reviews"), 0),
+                      rating_sum=Coalesce(Sum("rating__rating_sum"), 0)))
+    return {row.pop("category_id"): row for row in rows}
+
+
+# Recalcula las estadísticas de las categorías indicadas (o de todas) y las
+# guarda con un único INSERT ... ON CONFLICT / ON DUPLICATE KEY
+def refresh_category_stats(category_ids=None):
+    aggregates = category_aggregates(category_ids)
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(id__in=category_ids)
+    stats = [CategoryStats(category_id=category_id, **aggregates.get(category_id, EMPTY_STATS))
+             for category_id in categories.values_list("id", flat=True)]
+
+    kwargs = {"update_conflicts": True, "update_fields": STATS_FIELDS}
+    if connection.features.supports_update_conflicts_with_target:
+        kwargs["unique_fields"] = ["category"]
+    CategoryStats.objects.bulk_create(stats, **kwargs)
+    bump_categories_version()
+    return len(stats)
+
+
+# Las reseñas cambian solo los totales de calificación: se aplican como delta
+# con un UPDATE basado en F(), igual que en ProductRating
+def apply_category_rating_delta(category_id, count_delta, sum_delta):
+    if category_id is None:
+        return
+    updated = CategoryStats.objects.filter(category_id=category_id).update(
+        total_reviews=F("total_reviews") + count_delta, rating_sum=F("rating_sum") + sum_delta)
+    if updated:
+        bump_categories_version()
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .caching import CATALOG_VERSION, CATEGORIES_VERSION, get_versions, product_version
+from .models import Cart
+
+
+# Validadores baratos para peticiones condicionales (If-None-Match /
+# If-Modified-Since). Si el recurso no cambió se responde 304 sin ejecutar la
+# vista ni los serializadores.
+
+# ----------------------- CARRITO -----------------------
+
+def cart_updated_at(request, cart_code):
+    # Una sola consulta por petición
+    if not hasattr(request, "_cart_updated_at"):
+        request._cart_updated_at = (Cart.objects.filter(cart_code=cart_code)
+                                    .values_list("updated_at", flat=True).first())
+    return request._cart_updated_at
+
+
+# Los ítems del carrito muestran el nombre y el precio actuales de los
+# productos: el ETag incluye también la versión del catálogo. No se envía
+# Last-Modified porque updated_at no refleja esos cambios.
+def cart_etag(request, cart_code):
+    updated_at = cart_updated_at(request, cart_code)
+    if updated_at is None:
+        return None
+    return "cart-{}-{}-{}".format(cart_code, updated_at.timestamp(), *get_versions([CATALOG_VERSION]))
+
+
+def cart_code_param(validator):
+    # get_cart_stat recibe el cart_code como parámetro de la query
+    return lambda request: validator(request, request.GET.get("cart_code"))
+
+
+# El carrito cambia con cada acción del usuario: el navegador siempre revalida
+def conditional_cart(from_query=False):
+    etag_func = cart_code_param(cart_etag) if from_query else cart_etag
+
+    def decorator(view):
+        view = condition(etag_func=etag_func)(view)
+        return cache_control(private=True, no_cache=True)(view)
+    return decorator
+
+
+# ----------------------- CATÁLOGO -----------------------
+
+def catalog_etag(request, *args, **kwargs):
+    return "catalog-{}".format(*get_versions([CATALOG_VERSION]))
+
+
+def category_list_etag(request, *args, **kwargs):
+    return "categories-{}-{}".format(*get_versions([CATALOG_VERSION, CATEGORIES_VERSION]))
+
+
+def product_etag(request, slug):
+    return "product-{}-{}".format(*get_versions([CATALOG_VERSION, product_version(slug)]))
+
+
+def conditional_catalog(etag_func):
+    def decorator(view):
+        view = condition(etag_func=etag_func)(view)
+        return cache_control(public=True, max_age=settings.CATALOG_CACHE_MAX_AGE)(view)
+    return decorator
@@ -0,0 +1,174 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, Count, F, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+
+
+# Filtros (facets) y orden de los listados de productos (category_detail y
+# search). Los conteos de cada facet se calculan con un único GROUP BY, con
+# todos los filtros aplicados menos el propio, así el cliente puede mostrar
+# cuántos productos quedan al cambiar ese filtro.
+
+# Orden: columnas de la paginación por cursor (el id desempata)
+SORTS = {
+    "price": ("price", "id"),
+    "-price": ("-price", "-id"),
+    "rating": ("-average_rating", "id"),
+    "newest": ("-id",),  # Product no tiene fecha de creación: los ids son crecientes
+}
+# Límites de los rangos del facet de precio: [0, 10), [10, 25), ... [1000, ∞)
+PRICE_BUCKETS = [10, 25, 50, 100, 250, 500, 1000]
+# Niveles del facet de calificación mínima (promedio de ProductRating)
+RATING_LEVELS = [4, 3, 2, 1]
+BOOLEAN_VALUES = {"true": True, "1": True, "false": False, "0": False}
+
+CATEGORY_FACETS = ["price", "rating", "featured"]
+SEARCH_FACETS = ["category", "price", "rating", "featured"]
+
+
+def parse_price(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"{name} must be a number")
+    if not price.is_finite() or price < 0:
+        raise ValueError(f"{name} must be a positive number")
+    return price
+
+
+def parse_boolean(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    if value.lower() not in BOOLEAN_VALUES:
+        raise ValueError(f"{name} must be true or false")
+    return BOOLEAN_VALUES[value.lower()]
+
+
+# Condición de cada filtro enviado, por facet. max_price es exclusivo, igual
+# que los rangos del facet de precio.
+def parse_filters(params, facets):
+    filters = {}
+    min_price, max_price = parse_price(params, "min_price"), parse_price(params, "max_price")
+    if min_price is not None or max_price is not None:
+        condition = Q()
+        if min_price is not None:
+            condition &= Q(price__gte=min_price)
+        if max_price is not None:
+            condition &= Q(price__lt=max_price)
+        filters["price"] = condition
+
+    min_rating = params.get("min_rating")
+    if min_rating not in (None, ""):
+        try:
+            min_rating = float(min_rating)
+        except ValueError:
+            raise ValueError("min_rating must be a number")
+        if not 0 <= min_rating <= 5:
+            raise ValueError("min_rating must be between 0 and 5")
+        # Los productos sin reseñas cuentan con promedio 0 (igual que en sort_products):
+        # con min_rating=0 no se filtra, así el JOIN con ProductRating no los descarta
+        if min_rating > 0:
+            filters["rating"] = Q(rating__average_rating__gte=min_rating)
+
+    featured = parse_boolean(params, "featured")
+    if featured is not None:
+        filters["featured"] = Q(featured=featured)
+
+    category = params.get("category")
+    if category and "category" in facets:
+        filters["category"] = Q(category__slug__in=[slug for slug in category.split(",") if slug])
+    return filters
+
+
+def apply_filters(queryset, filters, exclude=None):
+    for name, condition in filters.items():
+        if name != exclude:
+            queryset = queryset.filter(condition)
+    return queryset
+
+
+def sort_products(queryset, sort, default_ordering):
+    if not sort:
+        return queryset, default_ordering
+    if sort not in SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(SORTS)}")
+    if sort == "rating":
+        # Los productos sin reseñas quedan al final (promedio 0)
+        queryset = queryset.annotate(average_rating=Coalesce("rating__average_rating", Value(0.0),
+                                                             output_field=FloatField()))
+    return queryset, SORTS[sort]
+
+
+# ----------------------- CONTEOS -----------------------
+
+def grouped_counts(queryset, expression):
+    rows = queryset.order_by().annotate(facet=expression).values("facet").annotate(count=Count("id"))
+    return {row["facet"]: row["count"] for row in rows}
+
+
+def price_facet(queryset):
+    bucket = Case(*[When(price__lt=bound, then=Value(index)) for index, bound in enumerate(PRICE_BUCKETS)],
+                  default=Value(len(PRICE_BUCKETS)), output_field=IntegerField())
+    counts = grouped_counts(queryset, bucket)
+    bounds = [0, *PRICE_BUCKETS, None]
+    return [{"min_price": low, "max_price": high, "count": counts.get(index, 0)}
+            for index, (low, high) in enumerate(zip(bounds, bounds[1:]))]
+
+
+def rating_facet(queryset):
+    level = Case(*[When(rating__average_rating__gte=level, then=Value(level)) for level in RATING_LEVELS],
+                 default=Value(0), output_field=IntegerField())
+    counts = grouped_counts(queryset, level)
+    # Cada nivel cuenta los productos con ese promedio o más
+    facet, total = [], 0
+    for level in RATING_LEVELS:
+        total += counts.get(level, 0)
+        facet.append({"min_rating": level, "count": total})
+    return facet
+
+
+def featured_facet(queryset):
+    counts = grouped_counts(queryset, F("featured"))
+    return [{"featured": value, "count": counts.get(value, 0)} for value in (True, False)]
+
+
+def category_facet(queryset):
+    rows = (queryset.filter(category__isnull=False).order_by().values("category__slug", "category__name")
+            .annotate(count=Count("id")).order_by("-count", "category__name"))
+    return [{"slug": row["category__slug"], "name": row["category__name"], "count": row["count"]} for row in rows]
+
+
+FACETS = {
+    "category": category_facet,
+    "price": price_facet,
+    "rating": rating_facet,
+    "featured": featured_facet,
+}
+
+
+# Listado filtrado y ordenado según los parámetros de la petición. Con
+# facets=true la vista agrega los conteos (una consulta por facet).
+class FacetedProducts:
+
+    def __init__(self, queryset, params, facets, default_ordering="id"):
+        self.base = queryset
+        self.facets = facets
+        self.filters = parse_filters(params, facets)
+        self.products, self.ordering = sort_products(apply_filters(queryset, self.filters), params.get("sort"),
+                                                     default_ordering)
+        self.with_counts = bool(parse_boolean(params, "facets"))
+
+    def counts(self):
+        return {name: FACETS[name](apply_filters(self.base, self.filters, exclude=name)) for name in self.facets}
+
+
+# Agrega los conteos a la respuesta de un listado (en el formato de lista, los
+# productos pasan a "results")
+def with_facets(data, counts):
+    if isinstance(data, list):
+        return {"results": data, "facets": counts}
+    return {**data, "facets": counts}
@@ -0,0 +1,246 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger("apiApp.performance")
+
+# Límites (superiores) de los buckets de los histogramas
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]  # segundos
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100]
+
+# Sentencias repetidas que se incluyen en el log de peticiones lentas
+SLOW_LOG_TOP_QUERIES = 5
+
+# Métricas de la petición en curso. Una variable de contexto (y no
+# connection.execute_wrapper en el middleware) porque las vistas async consultan
+# la base de datos desde sync_to_async, con la conexión de otro hilo, y el
+# contexto sí se copia a ese hilo.
+current_request = ContextVar("current_request", default=None)
+
+
+# ----------------------- MEDICIÓN POR PETICIÓN -----------------------
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.statements = Counter()
+
+    # Envoltorio de las consultas (ver measure_query): cuenta y cronometra cada una
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            # El SQL llega con marcadores (%s): las consultas N+1 se agrupan en una sola sentencia
+            self.statements[sql] += 1
+
+    def repeated_statements(self, limit=SLOW_LOG_TOP_QUERIES):
+        return [(sql, count) for sql, count in self.statements.most_common(limit) if count > 1]
+
+
+def measure_query(execute, sql, params, many, context):
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+# Cada conexión nueva pasa sus consultas por measure_query (fuera de una
+# petición medida solo agrega una llamada)
+@receiver(connection_created)
+def install_query_timing(sender, connection, **kwargs):
+    if measure_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(measure_query)
+
+
+# Cronometra la serialización (to_representation) de los serializadores de
+# serializers.py. Solo cuenta el más externo: los anidados y los hijos de un
+# ListSerializer quedan dentro de su tiempo. Incluye las consultas perezosas
+# que se hagan al serializar, que también suman en el tiempo de la base de datos.
+class TimedSerializerMixin:
+
+    def to_representation(self, instance):
+        metrics = current_request.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+            metrics.serializing = False
+
+
+# ----------------------- HISTOGRAMAS -----------------------
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            cumulative += count
+            yield bound, cumulative
+
+
+class EndpointMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = defaultdict(lambda: Histogram(DURATION_BUCKETS))
+        self.query_counts = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.totals = defaultdict(Counter)
+
+    def record(self, endpoint, status_code, duration, metrics, response_size):
+        with self.lock:
+            self.durations[endpoint].observe(duration)
+            self.query_counts[endpoint].observe(metrics.queries)
+            totals = self.totals[endpoint]
+            totals[f"{status_code // 100}xx"] += 1
+            totals["db_seconds"] += metrics.db_time
+            totals["serializer_seconds"] += metrics.serializer_time
+            totals["render_seconds"] += metrics.render_time
+            totals["response_bytes"] += response_size or 0
+
+    def reset(self):
+        with self.lock:
+            self.durations.clear()
+            self.query_counts.clear()
+            self.totals.clear()
+
+    # Formato de texto de Prometheus (exposition format 0.0.4)
+    def prometheus(self):
+        lines = []
+
+        def histogram(name, help_text, histograms):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for endpoint, values in sorted(histograms.items()):
+                for bound, count in values.samples():
+                    lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {values.total:g}')
+                lines.append(f'{name}_count{{endpoint="{endpoint}"}} {sum(values.counts)}')
+
+        def counter(name, help_text, key):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for endpoint, totals in sorted(self.totals.items()):
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {totals[key]:g}')
+
+        with self.lock:
+            histogram("apiapp_request_duration_seconds", "Tiempo total de la petición", self.durations)
+            histogram("apiapp_request_queries", "Consultas SQL por petición", self.query_counts)
+            counter("apiapp_db_seconds_total", "Tiempo en la base de datos", "db_seconds")
+            counter("apiapp_serializer_seconds_total", "Tiempo en los serializadores", "serializer_seconds")
+            counter("apiapp_render_seconds_total", "Tiempo en renderizar la respuesta", "render_seconds")
+            counter("apiapp_response_bytes_total", "Bytes de las respuestas", "response_bytes")
+            lines.append("# HELP apiapp_responses_total Respuestas por clase de estado")
+            lines.append("# TYPE apiapp_responses_total counter")
+            for endpoint, totals in sorted(self.totals.items()):
+                for status_class in sorted(key for key in totals if key.endswith("xx")):
+                    lines.append(f'apiapp_responses_total{{endpoint="{endpoint}",status="{status_class}"}} '
+                                 f'{totals[status_class]}')
+        return "\n".join(lines) + "\n"
+
+
+endpoint_metrics = EndpointMetrics()
+
+
+# ----------------------- MIDDLEWARE -----------------------
+
+# Mide las vistas de apiApp: tiempo total, consultas (número y tiempo), tiempo
+# en los serializadores, de renderizado de la respuesta y su tamaño. Agrega la cabecera Server-Timing,
+# registra las peticiones lentas y alimenta los histogramas de /metrics.
+# Funciona en modo síncrono y asíncrono, así las vistas async no pasan por un
+# hilo por estar detrás de este middleware.
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.acall(request)
+        start = time.perf_counter()
+        metrics = request.performance_metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, time.perf_counter() - start, metrics)
+
+    async def acall(self, request):
+        start = time.perf_counter()
+        metrics = request.performance_metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, time.perf_counter() - start, metrics)
+
+    # Las respuestas de DRF se convierten a JSON (JSONRenderer) al renderizarse,
+    # después de la vista: se cronometra ese paso aparte de los serializadores.
+    def process_template_response(self, request, response):
+        metrics = getattr(request, "performance_metrics", None)
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, duration, metrics):
+        match = request.resolver_match
+        if match is None or not match.func.__module__.startswith("apiApp."):
+            return response
+
+        response_size = None if response.streaming else len(response.content)
+        response["Server-Timing"] = ", ".join([
+            f"total;dur={duration * 1000:.1f}",
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+            f"serialize;dur={metrics.serializer_time * 1000:.1f}",
+            f"render;dur={metrics.render_time * 1000:.1f}",
+        ])
+        endpoint_metrics.record(match.url_name, response.status_code, duration, metrics, response_size)
+
+        if duration * 1000 >= settings.SLOW_REQUEST_MS:
+            repeated = "".join(f"\n  {count}x {sql}" for sql, count in metrics.repeated_statements())
+            logger.warning("Petición lenta %s %s (%s): %.0f ms, %d consultas (%.0f ms), serialización %.0f ms, "
+                           "renderizado %.0f ms%s",
+                           request.method, request.get_full_path(), match.url_name, duration * 1000,
+                           metrics.queries, metrics.db_time * 1000, metrics.serializer_time * 1000,
+                           metrics.render_time * 1000, repeated)
+        return response
@@ -0,0 +1,214 @@
+import json
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apiApp import urls
+from apiApp.management.commands.loadtest import percentile
+from apiApp.models import Cart, CartItem, Category, Product, Review
+
+
+User = get_user_model()
+
+# Rutas que no forman parte del tráfico de la tienda o dependen de la API de Stripe
+SKIPPED = {
+    "webhook": "requiere una firma válida de Stripe",
+    "create_checkout_session": "llama a la API de Stripe",
+    "create_checkout_session_async": "llama a la API de Stripe",
+    "export_orders": "exportación contable, solo para administradores",
+    "catalog_cache_stats": "solo para administradores",
+    "metrics": "solo para administradores",
+}
+
+SEARCH_TERMS = ["camara", "camisa", "libro", "azul", "digital", "reloj", "sony", "zapatos deportivo"]
+# Filtros, orden y conteos de facets.py: la mitad de los listados los usa
+LISTING_PARAMS = ["", "", "", "", "", "sort=price", "sort=-price&min_price=50&max_price=500", "sort=rating",
+                  "min_rating=4&featured=true", "facets=true&min_rating=3"]
+
+
+# Mezcla de peticiones: (nombre de la ruta, peso, función que arma la petición).
+# Los pesos imitan un tráfico típico de tienda: sobre todo lecturas del catálogo.
+def build_mix():
+    return [
+        ("product_list", 20, lambda p: ("get", reverse("product_list"), None)),
+        ("product_detail", 25, lambda p: ("get", reverse("product_detail", args=[p.choice("slugs")]), None)),
+        ("also_bought", 4, lambda p: ("get", reverse("also_bought", args=[p.choice("slugs")]), None)),
+        ("category_list", 5, lambda p: ("get", reverse("category_list"), None)),
+        ("category_detail", 8, lambda p: ("get", reverse("category_detail", args=[p.choice("categories")])
+                                          + f"?{p.rng.choice(LISTING_PARAMS)}", None)),
+        ("search", 10, lambda p: ("get", reverse("search")
+                                  + f"?query={p.rng.choice(SEARCH_TERMS)}&{p.rng.choice(LISTING_PARAMS)}", None)),
+        ("get_cart", 6, lambda p: ("get", reverse("get_cart", args=[p.choice("carts")]), None)),
+        ("get_cart_stat", 6, lambda p: ("get", reverse("get_cart_stat") + f"?cart_code={p.choice('carts')}", None)),
+        ("product_in_cart", 3, lambda p: ("get", reverse("product_in_cart")
+                                          + f"?cart_code={p.choice('carts')}&product_id={p.choice('products')}", None)),
+        ("product_in_wishlist", 3, lambda p: ("get", reverse("product_in_wishlist")
+                                              + f"?email={p.choice('emails')}&product_id={p.choice('products')}", None)),
+        ("wishlist_membership", 2, lambda p: ("get", reverse("wishlist_membership")
+                                              + f"?email={p.choice('emails')}&product_ids={p.choices('products', 40)}",
+                                              None)),
+        ("cart_membership", 2, lambda p: ("get", reverse("cart_membership")
+                                          + f"?cart_code={p.choice('carts')}&product_ids={p.choices('products', 40)}",
+                                          None)),
+        ("my_wishlists", 2, lambda p: ("get", reverse("my_wishlists") + f"?email={p.choice('emails')}", None)),
+        ("get_orders", 2, lambda p: ("get", reverse("get_orders") + f"?email={p.choice('emails')}", None)),
+        ("get_address", 1, lambda p: ("get", reverse("get_address") + f"?email={p.choice('emails')}", None)),
+        ("existing_user", 1, lambda p: ("get", reverse("existing_user", args=[p.choice("emails")]), None)),
+        ("add_to_cart", 4, lambda p: ("post", reverse("add_to_cart"),
+                                      {"cart_code": p.choice("carts"), "product_id": p.choice("products")})),
+        ("update_cartitem_quantity", 2, lambda p: ("put", reverse("update_cartitem_quantity"),
+                                                   {"item_id": p.choice("cartitems"), "quantity": p.rng.randint(1, 5)})),
+        ("delete_cartitem", 1, lambda p: ("delete", reverse("delete_cartitem", args=[p.choice("cartitems")]), None)),
+        ("batch_update_cart", 2, lambda p: ("post", reverse("batch_update_cart"), {
+            "cart_code": p.choice("carts"),
+            "operations": [{"action": "add", "product_id": p.choice("products"), "quantity": 2} for _ in range(3)],
+        })),
+        ("add_to_wishlist", 2, lambda p: ("post", reverse("add_to_wishlist"),
+                                          {"email": p.choice("emails"), "product_id": p.choice("products")})),
+        ("add_review", 1, lambda p: ("post", reverse("add_review"), {
+            "product_id": p.choice("products"), "email": p.choice("emails"),
+            "rating": p.rng.randint(1, 5), "review": "Reseña de prueba",
+        })),
+        ("update_review", 1, lambda p: ("put", reverse("update_review", args=[p.choice("reviews")]),
+                                        {"rating": p.rng.randint(1, 5), "review": "Reseña editada"})),
+        ("delete_review", 1, lambda p: ("delete", reverse("delete_review", args=[p.choice("reviews")]), None)),
+        ("create_user", 1, lambda p: ("post", reverse("create_user"), {
+            "username": f"bench{p.next_id()}", "email": f"bench{p.next_id()}@example.com",
+            "first_name": "Bench", "last_name": "Mark", "profile_picture_url": "",
+        })),
+        ("add_address", 1, lambda p: ("post", reverse("add_address"), {
+            "email": p.choice("emails"), "street": "Calle 1", "city": "Bogotá", "state": "Cundinamarca",
+            "phone": "3000000000",
+        })),
+    ]
+
+
+# Muestras de datos reales de la base para armar las peticiones
+class Pools:
+
+    def __init__(self, rng, size):
+        self.rng = rng
+        self.counter = 0
+        self.values = {
+            "slugs": self.sample(Product.objects.values_list("slug", flat=True), size),
+            "products": self.sample(Product.objects.values_list("id", flat=True), size),
+            "categories": self.sample(Category.objects.values_list("slug", flat=True), size),
+            "carts": self.sample(Cart.objects.values_list("cart_code", flat=True), size),
+            "cartitems": self.sample(CartItem.objects.values_list("id", flat=True), size),
+            "reviews": self.sample(Review.objects.values_list("id", flat=True), size),
+            "emails": self.sample(User.objects.values_list("email", flat=True), size),
+        }
+
+    @staticmethod
+    def sample(queryset, size):
+        # Las filas más recientes de una tabla grande bastan como muestra
+        return list(queryset.order_by("-id")[:size])
+
+    def choice(self, name):
+        return self.rng.choice(self.values[name])
+
+    def choices(self, name, count):
+        return ",".join(str(value) for value in self.rng.choices(self.values[name], k=count))
+
+    def next_id(self):
+        self.counter += 1
+        return f"{int(time.time())}{self.counter}"
+
+    def missing(self, builder):
+        try:
+            builder(self)
+        except IndexError:
+            return True
+        return False
+
+
+class Command(BaseCommand):
+    help = ('Reproduce en el proceso una mezcla realista de peticiones contra todas las rutas de apiApp '
+            'y reporta throughput, latencias p50/p95/p99 y consultas por petición')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Peticiones totales')
+        parser.add_argument('--warmup', type=int, default=100, help='Peticiones previas que no se miden')
+        parser.add_argument('--sample-size', type=int, default=1000,
+                            help='Filas de cada tabla usadas para armar las peticiones')
+        parser.add_argument('--only', action='append', help='Limita la mezcla a estas rutas (se puede repetir)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        pools = Pools(rng, options['sample_size'])
+        mix = build_mix()
+        if options['only']:
+            mix = [entry for entry in mix if entry[0] in options['only']]
+
+        covered = {name for name, weight, builder in build_mix()} | SKIPPED.keys()
+        for pattern in urls.urlpatterns:
+            if pattern.name not in covered:
+                self.stdout.write(self.style.WARNING(f'La ruta "{pattern.name}" no está en la mezcla'))
+        for name, reason in SKIPPED.items():
+            self.stdout.write(f'Se omite "{name}": {reason}')
+
+        # Sin datos para armar una petición (p. ej. no hay reseñas) se omite la ruta
+        for name, weight, builder in mix:
+            if pools.missing(builder):
+                self.stdout.write(self.style.WARNING(f'Se omite "{name}": no hay datos de muestra'))
+        mix = [entry for entry in mix if not pools.missing(entry[2])]
+        if not mix:
+            raise CommandError('No hay datos: ejecute primero seed_bulk')
+
+        # Los errores de las vistas se cuentan como respuestas 500 en lugar de interrumpir la medición
+        client = Client(raise_request_exception=False)
+        names = [name for name, weight, builder in mix]
+        weights = [weight for name, weight, builder in mix]
+        builders = {name: builder for name, weight, builder in mix}
+
+        for _ in range(options['warmup']):
+            self.request(client, *builders[rng.choices(names, weights)[0]](pools))
+
+        results = defaultdict(lambda: {"latencies": [], "queries": [], "errors": 0})
+        start = time.perf_counter()
+        for _ in range(options['requests']):
+            name = rng.choices(names, weights)[0]
+            latency, queries, status = self.request(client, *builders[name](pools))
+            results[name]["latencies"].append(latency)
+            results[name]["queries"].append(queries)
+            results[name]["errors"] += status >= 500
+        self.report(results, time.perf_counter() - start)
+
+    def request(self, client, method, path, data):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if method == "get":
+                response = client.get(path)
+            else:
+                # Las escrituras se revierten para que la base no cambie entre ejecuciones
+                with transaction.atomic():
+                    response = getattr(client, method)(path, json.dumps(data) if data else None,
+                                                       content_type="application/json")
+                    transaction.set_rollback(True)
+            latency = (time.perf_counter() - start) * 1000
+        return latency, len(queries), response.status_code
+
+    def report(self, results, elapsed):
+        total = sum(len(result["latencies"]) for result in results.values())
+        self.stdout.write(f'{"ruta":28} {"n":>6} {"err":>5} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"consultas":>10}')
+        all_latencies, all_queries = [], []
+        for name, result in sorted(results.items()):
+            latencies, queries = result["latencies"], result["queries"]
+            all_latencies += latencies
+            all_queries += queries
+            self.stdout.write(f'{name:28} {len(latencies):>6} {result["errors"]:>5} '
+                              f'{statistics.median(latencies):>8.1f} {percentile(latencies, 95):>8.1f} '
+                              f'{percentile(latencies, 99):>8.1f} {statistics.mean(queries):>10.1f}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} peticiones en {elapsed:.2f}s: {total / elapsed:.1f} req/s, '
+            f'p50 {statistics.median(all_latencies):.1f} ms, p95 {percentile(all_latencies, 95):.1f} ms, '
+            f'p99 {percentile(all_latencies, 99):.1f} ms, {statistics.mean(all_queries):.1f} consultas/petición'))
@@ -0,0 +1,33 @@
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+
+from apiApp.recommendations import (BATCH_SIZE, RECOMMENDATIONS_LIMIT, WISHLIST_WEIGHT, build_recommendations,
+                                    update_recommendations)
+
+
+class Command(BaseCommand):
+    help = ('Calcula "los clientes también compraron" (top-K por compras y listas de deseos en común) '
+            'con matrices dispersas. Con --incremental solo procesa las órdenes y deseos nuevos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true')
+        parser.add_argument('--top-k', type=int, default=RECOMMENDATIONS_LIMIT)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--wishlist-weight', type=float, default=WISHLIST_WEIGHT)
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        build = update_recommendations if options['incremental'] else build_recommendations
+        result = build(options['top_k'], options['batch_size'], options['wishlist_weight'])
+        elapsed = time.monotonic() - start
+
+        run = result['run']
+        # ru_maxrss está en KB en Linux
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomendaciones ({"completa" if run.full else "incremental"}): {run.products_updated} productos, '
+            f'{result["links"]} filas, {result["pairs"]} pares de {result["baskets"]} canastas '
+            f'en {elapsed:.2f}s (carga {result["load_seconds"]:.2f}s); '
+            f'matrices {result["matrix_bytes"] / 2**20:.1f} MB, memoria máxima {peak_mb:.0f} MB'))
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apiApp.catalog_io import ProductImporter
+from apiApp.streaming import FORMATS, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Importa productos desde un CSV o JSONL de cualquier tamaño, insertando o actualizando por slug'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archivo a importar ("-" para la entrada estándar)')
+        parser.add_argument('--format', choices=FORMATS, help='Por defecto se deduce de la extensión')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--no-create-categories', action='store_true',
+                            help='Omite las filas con categorías inexistentes en lugar de crearlas')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        importer = ProductImporter(batch_size=options['batch_size'],
+                                   create_categories=not options['no_create_categories'])
+        try:
+            if path == "-":
+                stats = importer.run(read_rows(sys.stdin, fmt))
+            else:
+                with open(path, newline="", encoding="utf-8") as file:
+                    stats = importer.run(read_rows(file, fmt))
+        except (OSError, ValueError) as error:
+            raise CommandError(f'No se pudo importar {path}: {error}')
+
+        for error in stats["errors"]:
+            self.stdout.write(self.style.WARNING(error))
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats["rows"]} filas en {stats["elapsed"]:.2f}s ({stats["rows_per_second"]:.0f} filas/s): '
+            f'{stats["created"]} creados, {stats["updated"]} actualizados, {stats["skipped"]} omitidos'))
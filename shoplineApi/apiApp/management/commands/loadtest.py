@@ -0,0 +1,75 @@
+import asyncio
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+from django.core.management.base import BaseCommand
+
+
+DEFAULT_PATHS = [
+    "product_list",
+    "category_list",
+    "search?query=camara",
+]
+
+
+def percentile(samples, percent):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Prueba de carga HTTP contra un servidor en ejecución (p. ej. uvicorn vs gunicorn)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Ruta a probar (se puede repetir). Por defecto: listados y búsqueda')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=1000, help='Peticiones totales')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        results, elapsed = asyncio.run(self.run(options['base_url'], paths, options))
+        self.report(results, elapsed)
+
+    async def run(self, base_url, paths, options):
+        results = defaultdict(lambda: {"latencies": [], "errors": 0})
+        counter = iter(range(options['requests']))
+        limits = httpx.Limits(max_connections=options['concurrency'])
+
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=options['timeout']) as client:
+            async def worker():
+                for number in counter:
+                    path = paths[number % len(paths)]
+                    start = time.perf_counter()
+                    try:
+                        response = await client.get(path)
+                        ok = response.status_code < 500
+                    except httpx.HTTPError:
+                        ok = False
+                    results[path]["latencies"].append((time.perf_counter() - start) * 1000)
+                    results[path]["errors"] += not ok
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(options['concurrency'])))
+            return results, time.perf_counter() - start
+
+    def report(self, results, elapsed):
+        total = sum(len(result["latencies"]) for result in results.values())
+        self.stdout.write(f'{"ruta":40} {"n":>6} {"err":>5} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+        all_latencies = []
+        for path, result in results.items():
+            latencies = result["latencies"]
+            all_latencies += latencies
+            self.stdout.write(f'{path:40} {len(latencies):>6} {result["errors"]:>5} '
+                              f'{statistics.median(latencies):>8.1f} {percentile(latencies, 95):>8.1f} '
+                              f'{percentile(latencies, 99):>8.1f}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} peticiones en {elapsed:.2f}s: {total / elapsed:.1f} req/s, '
+            f'p50 {statistics.median(all_latencies):.1f} ms, p95 {percentile(all_latencies, 95):.1f} ms, '
+            f'p99 {percentile(all_latencies, 99):.1f} ms'))
@@ -0,0 +1,49 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from apiApp.webhooks import claim_events, process_event
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de eventos de Stripe guardados por el webhook'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Hilos procesando eventos en paralelo')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Intentos antes de dejar el evento en estado "Dead"')
+        parser.add_argument('--backoff', type=int, default=30, help='Segundos base de espera entre reintentos')
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Segundos tras los que se recupera un evento "Processing" abandonado')
+        parser.add_argument('--poll-interval', type=float, default=5.0)
+        parser.add_argument('--once', action='store_true', help='Procesa lo pendiente y termina')
+
+    def handle(self, *args, **options):
+        def process(event_id):
+            return process_event(event_id, options['max_attempts'], options['backoff'])
+
+        executor = ThreadPoolExecutor(max_workers=options['concurrency']) if options['concurrency'] > 1 else None
+        processed = failed = 0
+        try:
+            while True:
+                event_ids = claim_events(options['batch_size'], options['stale_after'])
+                if not event_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                results = executor.map(process, event_ids) if executor else map(process, event_ids)
+                for ok in results:
+                    processed += ok
+                    failed += not ok
+                self.stdout.write(f'{processed} eventos procesados, {failed} fallidos')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(f'Cola procesada: {processed} eventos correctos, {failed} fallidos'))
@@ -0,0 +1,67 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apiApp.models import Cart, CartItem
+
+
+class Command(BaseCommand):
+    help = 'Elimina por lotes los carritos sin actividad durante más de --ttl-days días (y sus ítems)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-days', type=int, default=settings.CART_TTL_DAYS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Segundos de pausa entre lotes para no acaparar la base de datos')
+        parser.add_argument('--dry-run', action='store_true', help='Solo cuenta los carritos a eliminar')
+        parser.add_argument('--optimize', action='store_true',
+                            help='Al terminar, compacta las tablas del carrito (OPTIMIZE TABLE en MySQL)')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['ttl_days'])
+        expired = Cart.objects.filter(updated_at__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'{expired.count()} carritos sin actividad desde {cutoff:%Y-%m-%d %H:%M}')
+            return
+
+        start = time.monotonic()
+        carts = items = 0
+        while True:
+            # Cada lote es una transacción corta. Con SKIP LOCKED (MySQL) se
+            # saltan los carritos que una petición está modificando.
+            with transaction.atomic():
+                cart_ids = list(expired.select_for_update(skip_locked=True).order_by("updated_at", "id")
+                                .values_list("id", flat=True)[:options['batch_size']])
+                if not cart_ids:
+                    break
+                # Se vuelve a filtrar por updated_at por si el carrito se usó mientras tanto
+                deleted, per_model = Cart.objects.filter(id__in=cart_ids, updated_at__lt=cutoff).delete()
+            carts += per_model.get(Cart._meta.label, 0)
+            items += per_model.get(CartItem._meta.label, 0)
+            self.stdout.write(f'{carts} carritos y {items} ítems eliminados...')
+            if len(cart_ids) < options['batch_size']:
+                break
+            time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{carts} carritos y {items} ítems eliminados en {elapsed:.2f}s (inactivos desde {cutoff:%Y-%m-%d})'))
+
+        if options['optimize']:
+            self.optimize_tables()
+
+    def optimize_tables(self):
+        if connection.vendor != "mysql":
+            self.stdout.write(self.style.WARNING('--optimize solo está disponible en MySQL'))
+            return
+        with connection.cursor() as cursor:
+            for model in (CartItem, Cart):
+                # InnoDB reconstruye la tabla en línea (sin bloquear escrituras)
+                cursor.execute(f"OPTIMIZE TABLE {connection.ops.quote_name(model._meta.db_table)}")
+                cursor.fetchall()
+        self.stdout.write(self.style.SUCCESS('Tablas del carrito compactadas'))
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apiApp.category_stats import refresh_category_stats
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las estadísticas de las categorías (productos, destacados, precios y calificación)'
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        refreshed = refresh_category_stats()
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Estadísticas de {refreshed} categorías recalculadas en {elapsed:.2f}s'))
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from apiApp.caching import bump_catalog_version
+from apiApp.category_stats import refresh_category_stats
+from apiApp.models import Product, ProductRating, Review
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye (o verifica con --verify) los contadores de ProductRating a partir de las reseñas'
+
+    COUNTER_FIELDS = ["total_reviews", "rating_sum", *ProductRating.STAR_FIELDS.values()]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Solo reporta las diferencias, sin modificar la base de datos')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def expected_counters(self):
+        # Un único GROUP BY sobre las reseñas: producto -> contadores esperados
+        star_counts = {field: Count("id", filter=Q(rating=rating))
+                       for rating, field in ProductRating.STAR_FIELDS.items()}
+        rows = (Review.objects.order_by().values("product_id")
+                .annotate(total_reviews=Count("id"), rating_sum=Sum("rating"), **star_counts))
+        return {row.pop("product_id"): row for row in rows}
+
+    def handle(self, *args, **options):
+        expected = self.expected_counters()
+        empty = dict.fromkeys(self.COUNTER_FIELDS, 0)
+
+        ratings = {rating.product_id: rating for rating in ProductRating.objects.all()}
+        to_update, to_create = [], []
+
+        for product_id, rating in ratings.items():
+            counters = expected.get(product_id, empty)
+            if any(getattr(rating, field) != counters[field] for field in self.COUNTER_FIELDS):
+                for field in self.COUNTER_FIELDS:
+                    setattr(rating, field, counters[field])
+                rating.average_rating = self.average(counters)
+                to_update.append(rating)
+
+        existing_products = set(Product.objects.filter(id__in=expected.keys()).values_list("id", flat=True))
+        for product_id in existing_products - ratings.keys():
+            counters = expected[product_id]
+            to_create.append(ProductRating(product_id=product_id, average_rating=self.average(counters), **counters))
+
+        if options['verify']:
+            for rating in to_update:
+                self.stdout.write(self.style.WARNING(f'Contadores desactualizados para el producto {rating.product_id}'))
+            for rating in to_create:
+                self.stdout.write(self.style.WARNING(f'Falta la valoración del producto {rating.product_id}'))
+            if to_update or to_create:
+                self.stdout.write(self.style.ERROR(f'{len(to_update) + len(to_create)} valoraciones inconsistentes'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Todas las valoraciones son consistentes'))
+            return
+
+        with transaction.atomic():
+            ProductRating.objects.bulk_update(to_update, ["average_rating", *self.COUNTER_FIELDS],
+                                              batch_size=options['batch_size'])
+            ProductRating.objects.bulk_create(to_create, batch_size=options['batch_size'])
+        # bulk_update/bulk_create no emiten señales: se recalculan las categorías
+        # y se invalida el caché del catálogo
+        if to_update or to_create:
+            refresh_category_stats()
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(to_update)} valoraciones corregidas, {len(to_create)} valoraciones creadas'))
+
+    @staticmethod
+    def average(counters):
+        if not counters["total_reviews"]:
+            return 0.0
+        return counters["rating_sum"] / counters["total_reviews"]
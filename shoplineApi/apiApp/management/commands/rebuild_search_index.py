@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apiApp.models import Product, ProductSearchDocument
+from apiApp.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Indexa los productos para la búsqueda de texto completo (solo los que faltan, o todos con --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Reindexa todo el catálogo y elimina documentos huérfanos')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        products = Product.objects.order_by("id")
+
+        if options['full']:
+            orphans = (ProductSearchDocument.objects.exclude(product_id__in=Product.objects.values("id"))
+                       .values_list("product_id", flat=True))
+            backend.remove_products(list(orphans))
+        else:
+            # Los cambios posteriores los mantienen las señales de Product y Category
+            products = products.filter(search_document__isnull=True)
+
+        start = time.monotonic()
+        indexed = backend.index_products(products, batch_size=options['batch_size'])
+        elapsed = time.monotonic() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{indexed} productos indexados con {type(backend).__name__} en {elapsed:.2f}s'))
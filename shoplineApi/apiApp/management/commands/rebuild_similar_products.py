@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apiApp.similarity import rebuild_all_similar_products
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la tabla de productos similares (top-K por categoría, banda de precio y compras conjuntas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        rebuilt = rebuild_all_similar_products(options['batch_size'])
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Productos similares de {rebuilt} productos recalculados en {elapsed:.2f}s'))
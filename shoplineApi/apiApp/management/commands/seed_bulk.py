@@ -0,0 +1,164 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils.text import slugify
+
+from apiApp.caching import bump_catalog_version
+from apiApp.models import Cart, CartItem, Category, Order, OrderItem, Product, Review, Wishlist
+
+
+User = get_user_model()
+
+# Vocabulario para nombres de productos realistas (y útiles para la búsqueda)
+NOUNS = ['Cámara', 'Camisa', 'Chaqueta', 'Libro', 'Pastel', 'Control', 'Juguete', 'Vestido', 'Audífonos',
+         'Reloj', 'Zapatos', 'Mochila', 'Lámpara', 'Taza', 'Teclado', 'Pantalón', 'Bicicleta', 'Balón']
+ADJECTIVES = ['Digital', 'Azul', 'Clásico', 'Deportivo', 'Eléctrico', 'Compacto', 'Premium', 'Verde',
+              'Infantil', 'Inalámbrico', 'Artesanal', 'Moderno', 'Robusto', 'Ligero', 'Rojo', 'Vintage']
+BRANDS = ['Sony', 'Gucci', 'Tommy', 'Apple', 'Samsung', 'Nike', 'Lego', 'Bumble', 'Tundra', 'Andes']
+
+
+class Command(BaseCommand):
+    help = 'Genera datos sintéticos a gran escala (productos, usuarios, reseñas, carritos, listas de deseos y órdenes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--reviews', type=int, default=20000)
+        parser.add_argument('--carts', type=int, default=2000)
+        parser.add_argument('--wishlists', type=int, default=5000)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42, help='Semilla para obtener siempre los mismos datos')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        start = time.monotonic()
+
+        categories = list(Category.objects.values_list("id", flat=True))
+        if not categories:
+            call_command('seed_categories', stdout=self.stdout)
+            categories = list(Category.objects.values_list("id", flat=True))
+
+        product_ids = self.create_products(options['products'], categories)
+        user_ids, emails = self.create_users(options['users'])
+        if product_ids and user_ids:
+            self.create_reviews(options['reviews'], user_ids, product_ids)
+            self.create_wishlists(options['wishlists'], user_ids, product_ids)
+            self.create_orders(options['orders'], emails, product_ids)
+        if product_ids:
+            self.create_carts(options['carts'], product_ids)
+
+        # bulk_create no emite señales: se reconstruyen los datos derivados
+        self.stdout.write(self.style.NOTICE('Reconstruyendo valoraciones, índice de búsqueda, similares y estadísticas de categorías...'))
+        call_command('rebuild_ratings', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('rebuild_similar_products', stdout=self.stdout)
+        call_command('rebuild_category_stats', stdout=self.stdout)
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(f'Datos generados en {time.monotonic() - start:.1f}s'))
+
+    # Inserta los objetos en lotes sin mantenerlos todos en memoria
+    def bulk_insert(self, model, objects, label, **kwargs):
+        start = time.monotonic()
+        total = 0
+        batch = []
+        for obj in objects:
+            total += 1
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch, **kwargs)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch, **kwargs)
+        elapsed = time.monotonic() - start
+        self.stdout.write(f'{total} {label} en {elapsed:.1f}s ({total / max(elapsed, 1e-6):.0f} filas/s)')
+
+    # MySQL no devuelve los ids de bulk_create: se consultan los creados después de `last_id`
+    def new_ids(self, model, last_id):
+        return list(model.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True))
+
+    def last_id(self, model):
+        return model.objects.aggregate(Max("id"))["id__max"] or 0
+
+    # Pares (usuario, producto) distintos para respetar unique_together
+    def distinct_pairs(self, count, user_ids, product_ids):
+        count = min(count, len(user_ids) * len(product_ids))
+        products = product_ids[:]
+        self.rng.shuffle(products)
+        for index in range(count):
+            user_index = index % len(user_ids)
+            product_index = (user_index + index // len(user_ids)) % len(products)
+            yield user_ids[user_index], products[product_index]
+
+    def create_products(self, count, categories):
+        last_id = self.last_id(Product)
+
+        def products():
+            for index in range(last_id + 1, last_id + count + 1):
+                name = f'{self.rng.choice(NOUNS)} {self.rng.choice(ADJECTIVES)} {self.rng.choice(BRANDS)}'
+                yield Product(
+                    name=name,
+                    description=f'El {name} es un producto diseñado pensando en la calidad y el rendimiento.',
+                    price=Decimal(self.rng.randint(500, 500000)) / 100,
+                    # Slug único sin consultas: el sufijo es un número que aún no existe
+                    slug=f'{slugify(name)}-{index}',
+                    featured=self.rng.random() < 0.1,
+                    category_id=self.rng.choice(categories),
+                )
+
+        self.bulk_insert(Product, products(), 'productos')
+        return self.new_ids(Product, last_id)
+
+    def create_users(self, count):
+        last_id = self.last_id(User)
+        users = (User(username=f'bulk{index}', email=f'bulk{index}@example.com', password='!',
+                      first_name='Cliente', last_name=str(index))
+                 for index in range(last_id + 1, last_id + count + 1))
+        self.bulk_insert(User, users, 'usuarios')
+        # Las órdenes usan los emails reales de los usuarios creados
+        rows = list(User.objects.filter(id__gt=last_id).order_by("id").values_list("id", "email"))
+        return [user_id for user_id, email in rows], [email for user_id, email in rows]
+
+    def create_reviews(self, count, user_ids, product_ids):
+        reviews = (Review(user_id=user_id, product_id=product_id, rating=self.rng.choices(
+                       [1, 2, 3, 4, 5], weights=[1, 1, 2, 4, 5])[0], review='Reseña generada')
+                   for user_id, product_id in self.distinct_pairs(count, user_ids, product_ids))
+        self.bulk_insert(Review, reviews, 'reseñas', ignore_conflicts=True)
+
+    def create_wishlists(self, count, user_ids, product_ids):
+        wishlists = (Wishlist(user_id=user_id, product_id=product_id)
+                     for user_id, product_id in self.distinct_pairs(count, user_ids, product_ids))
+        self.bulk_insert(Wishlist, wishlists, 'listas de deseos', ignore_conflicts=True)
+
+    def create_carts(self, count, product_ids):
+        last_id = self.last_id(Cart)
+        carts = (Cart(cart_code=f'b{index:010d}') for index in range(last_id + 1, last_id + count + 1))
+        self.bulk_insert(Cart, carts, 'carritos')
+
+        def items():
+            for cart_id in self.new_ids(Cart, last_id):
+                for product_id in self.rng.sample(product_ids, min(len(product_ids), self.rng.randint(1, 5))):
+                    yield CartItem(cart_id=cart_id, product_id=product_id, quantity=self.rng.randint(1, 3))
+
+        self.bulk_insert(CartItem, items(), 'ítems de carrito')
+
+    def create_orders(self, count, emails, product_ids):
+        last_id = self.last_id(Order)
+        orders = (Order(stripe_checkout_id=f'cs_bulk_{index}', amount=Decimal(self.rng.randint(1000, 100000)) / 100,
+                        currency='usd', customer_email=self.rng.choice(emails), status='Paid')
+                  for index in range(last_id + 1, last_id + count + 1))
+        self.bulk_insert(Order, orders, 'órdenes')
+
+        def items():
+            for order_id in self.new_ids(Order, last_id):
+                for product_id in self.rng.sample(product_ids, min(len(product_ids), self.rng.randint(1, 4))):
+                    yield OrderItem(order_id=order_id, product_id=product_id, quantity=self.rng.randint(1, 3))
+
+        self.bulk_insert(OrderItem, items(), 'ítems de orden')
@@ -0,0 +1,62 @@
+from functools import wraps
+
+from .models import CartItem, Wishlist
+
+
+# Máximo de productos por consulta de pertenencia (una grilla de productos)
+MAX_PRODUCT_IDS = 200
+
+
+def parse_product_ids(value):
+    if isinstance(value, str):
+        value = [part for part in value.split(",") if part.strip()]
+    product_ids = [int(product_id) for product_id in value or []]
+    if len(product_ids) > MAX_PRODUCT_IDS:
+        raise ValueError(f"at most {MAX_PRODUCT_IDS} product_ids are allowed")
+    return product_ids
+
+
+# Cada función resuelve la pertenencia de todos los productos con una consulta
+def wishlist_product_ids(email, product_ids):
+    return set(Wishlist.objects.filter(user__email=email, product_id__in=product_ids)
+               .values_list("product_id", flat=True))
+
+
+def cart_product_ids(cart_code, product_ids):
+    return set(CartItem.objects.filter(cart__cart_code=cart_code, product_id__in=product_ids)
+               .values_list("product_id", flat=True))
+
+
+# Productos serializados (ProductListSerializer) dentro de la respuesta de un listado
+def listed_products(data, products_key):
+    if isinstance(data, dict):
+        return data.get(products_key or "results") or []
+    return data
+
+
+# Agrega in_wishlist (con ?email=) e in_cart (con ?cart_code=) a cada producto
+# del listado. Se aplica después del caché del catálogo: la respuesta cacheada es
+# la misma para todos y las marcas de cada usuario cuestan una consulta cada una.
+def with_membership_flags(products_key=None):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            email = request.query_params.get("email")
+            cart_code = request.query_params.get("cart_code")
+            if response.status_code != 200 or not (email or cart_code):
+                return response
+
+            products = listed_products(response.data, products_key)
+            product_ids = [product["id"] for product in products]
+            if email:
+                in_wishlist = wishlist_product_ids(email, product_ids)
+                for product in products:
+                    product["in_wishlist"] = product["id"] in in_wishlist
+            if cart_code:
+                in_cart = cart_product_ids(cart_code, product_ids)
+                for product in products:
+                    product["in_cart"] = product["id"] in in_cart
+            return response
+        return wrapper
+    return decorator
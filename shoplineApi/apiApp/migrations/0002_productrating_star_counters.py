@@ -0,0 +1,81 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:59
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+# Campo del contador por estrellas de cada calificación (ProductRating.STAR_FIELDS)
+STAR_FIELDS = {
+    1: "poor_reviews",
+    2: "fair_reviews",
+    3: "good_reviews",
+    4: "very_good_reviews",
+    5: "excellent_reviews",
+}
+
+
+# Recalcula las valoraciones a partir de las reseñas existentes: las señales
+# aplican deltas sobre estos contadores, que deben partir de los valores reales
+def populate_rating_counters(apps, schema_editor):
+    ProductRating = apps.get_model("apiApp", "ProductRating")
+    Review = apps.get_model("apiApp", "Review")
+    rows = (Review.objects.order_by().values("product_id")
+            .annotate(total_reviews=Count("id"), rating_sum=Sum("rating"),
+                      **{field: Count("id", filter=Q(rating=stars)) for stars, field in STAR_FIELDS.items()}))
+    aggregates = {row.pop("product_id"): row for row in rows}
+
+    ratings = list(ProductRating.objects.all())
+    for rating in ratings:
+        values = aggregates.pop(rating.product_id, None) or {"total_reviews": 0, "rating_sum": 0}
+        for field in ["total_reviews", "rating_sum", *STAR_FIELDS.values()]:
+            setattr(rating, field, values.get(field, 0))
+        rating.average_rating = rating.rating_sum / rating.total_reviews if rating.total_reviews else 0.0
+    ProductRating.objects.bulk_update(
+        ratings, ["average_rating", "total_reviews", "rating_sum", *STAR_FIELDS.values()], batch_size=1000)
+
+    # Productos con reseñas pero sin fila de valoración
+    ProductRating.objects.bulk_create([
+        ProductRating(product_id=product_id, average_rating=values["rating_sum"] / values["total_reviews"], **values)
+        for product_id, values in aggregates.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productrating',
+            name='excellent_reviews',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='fair_reviews',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='good_reviews',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='poor_reviews',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='very_good_reviews',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rating_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:02
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+FTS_TABLE = "apiApp_productsearch_fts"
+FULLTEXT_INDEX = "apiApp_productsearch_ft"
+
+
+# El índice de texto completo depende del motor: FULLTEXT en MySQL y una tabla
+# virtual FTS5 (sin tildes) en SQLite. Otros motores usan la búsqueda básica.
+def create_fulltext_index(apps, schema_editor):
+    table = apps.get_model("apiApp", "ProductSearchDocument")._meta.db_table
+    vendor = schema_editor.connection.vendor
+    if vendor == "mysql":
+        schema_editor.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX {FULLTEXT_INDEX} (document)")
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(document, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    table = apps.get_model("apiApp", "ProductSearchDocument")._meta.db_table
+    vendor = schema_editor.connection.vendor
+    if vendor == "mysql":
+        schema_editor.execute(f"ALTER TABLE {table} DROP INDEX {FULLTEXT_INDEX}")
+    elif vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+# Copia fija de search.normalize_search_text/build_document: la migración no
+# debe cambiar si cambia el código de la aplicación
+def normalize_search_text(text):
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def build_document(name, category_name, description):
+    return normalize_search_text(" ".join([name, category_name or "", description]))
+
+
+# Indexa los productos existentes (los nuevos los indexan las señales)
+def populate_search_documents(apps, schema_editor, batch_size=500):
+    Product = apps.get_model("apiApp", "Product")
+    ProductSearchDocument = apps.get_model("apiApp", "ProductSearchDocument")
+    connection = schema_editor.connection
+    rows = (Product.objects.order_by("id").values_list("id", "name", "category__name", "description")
+            .iterator(chunk_size=batch_size))
+
+    def write(documents):
+        ProductSearchDocument.objects.bulk_create(documents)
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, document) VALUES (%s, %s)",
+                                   [(document.product_id, document.document) for document in documents])
+
+    batch = []
+    for product_id, name, category_name, description in rows:
+        batch.append(ProductSearchDocument(product_id=product_id,
+                                           document=build_document(name, category_name, description)))
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = []
+    if batch:
+        write(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0002_productrating_star_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document', models.TextField()),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='apiApp.product')),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0004_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['cart', 'product'], name='apiApp_cart_cart_id_5319f4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer_email'], name='apiApp_orde_custome_325c6f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['featured'], name='apiApp_prod_feature_cb4e7a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-created'], name='apiApp_revi_product_dfb352_idx'),
+        ),
+    ]
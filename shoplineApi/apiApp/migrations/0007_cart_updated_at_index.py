@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0006_order_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['updated_at'], name='apiApp_cart_updated_8326a8_idx'),
+        ),
+    ]
@@ -0,0 +1,159 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:27
+
+import math
+from collections import defaultdict, deque
+from itertools import groupby
+from operator import itemgetter
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+# Copia fija del cálculo de similarity.py al crear esta migración: la migración
+# no debe cambiar (ni fallar) si cambia el código de la aplicación.
+SIMILAR_PRODUCTS_LIMIT = 8
+PRICE_NEIGHBOURS = 2 * SIMILAR_PRODUCTS_LIMIT
+COPURCHASE_CANDIDATES = 2 * SIMILAR_PRODUCTS_LIMIT
+CATEGORY_WEIGHT = 1.0
+PRICE_WEIGHT = 0.5
+COPURCHASE_WEIGHT = 1.0
+PRICE_BAND_RATIO = 2
+
+
+def price_band(price):
+    if price is None or price <= 0:
+        return None
+    return math.floor(math.log(float(price), PRICE_BAND_RATIO))
+
+
+def price_score(band, other_band):
+    if band is None or other_band is None:
+        return 0.0
+    return {0: 1.0, 1: 0.5}.get(abs(band - other_band), 0.0)
+
+
+def similarity_score(product, candidate, copurchases):
+    score = 0.0
+    if product["category_id"] is not None and product["category_id"] == candidate["category_id"]:
+        score += CATEGORY_WEIGHT
+    score += PRICE_WEIGHT * price_score(price_band(product["price"]), price_band(candidate["price"]))
+    score += COPURCHASE_WEIGHT * math.log1p(copurchases)
+    return score
+
+
+def top_similar(product, candidates, copurchases):
+    scored = []
+    for candidate in candidates.values():
+        score = similarity_score(product, candidate, copurchases.get(candidate["id"], 0))
+        distance = abs(candidate["price"] - product["price"])
+        scored.append((-score, distance, candidate["id"], score))
+    scored.sort()
+    return [(candidate_id, score) for _, _, candidate_id, score in scored[:SIMILAR_PRODUCTS_LIMIT]]
+
+
+def price_windows(rows):
+    for category_id, group in groupby(rows, key=itemgetter("category_id")):
+        if category_id is None:
+            for row in group:
+                yield row, []
+            continue
+
+        window = deque()
+        start = emitted = 0
+
+        def emit(position):
+            low = max(start, position - PRICE_NEIGHBOURS)
+            high = min(start + len(window), position + PRICE_NEIGHBOURS + 1)
+            return window[position - start], [window[i - start] for i in range(low, high) if i != position]
+
+        for row in group:
+            window.append(row)
+            while emitted + PRICE_NEIGHBOURS < start + len(window):
+                yield emit(emitted)
+                emitted += 1
+                while start < emitted - PRICE_NEIGHBOURS:
+                    window.popleft()
+                    start += 1
+        while emitted < start + len(window):
+            yield emit(emitted)
+            emitted += 1
+
+
+# Calcula los productos similares del catálogo existente (misma pasada que
+# similarity.rebuild_all_similar_products, con los modelos históricos)
+def populate_similar_products(apps, schema_editor, batch_size=1000):
+    OrderItem = apps.get_model("apiApp", "OrderItem")
+    Product = apps.get_model("apiApp", "Product")
+    SimilarProduct = apps.get_model("apiApp", "SimilarProduct")
+
+    def write(products, neighbours):
+        pairs = (OrderItem.objects.filter(product_id__in=[product["id"] for product in products])
+                 .values("product_id", other_id=F("order__items__product_id"))
+                 .annotate(orders=Count("order_id", distinct=True)).order_by())
+        copurchases = defaultdict(dict)
+        for pair in pairs:
+            if pair["other_id"] != pair["product_id"]:
+                copurchases[pair["product_id"]][pair["other_id"]] = pair["orders"]
+        for product_id, counts in copurchases.items():
+            copurchases[product_id] = dict(sorted(counts.items(), key=lambda item: -item[1])[:COPURCHASE_CANDIDATES])
+        copurchased = {candidate["id"]: candidate for candidate in Product.objects.filter(
+            id__in={other_id for counts in copurchases.values() for other_id in counts}).values("id", "category_id", "price")}
+
+        links = []
+        for product in products:
+            candidates = {candidate["id"]: candidate for candidate in neighbours[product["id"]]}
+            candidates.update((candidate_id, copurchased[candidate_id])
+                              for candidate_id in copurchases[product["id"]] if candidate_id in copurchased)
+            for rank, (similar_id, score) in enumerate(top_similar(product, candidates, copurchases[product["id"]])):
+                links.append(SimilarProduct(product_id=product["id"], similar_id=similar_id, rank=rank, score=score))
+        SimilarProduct.objects.bulk_create(links)
+
+    rows = Product.objects.order_by("category_id", "price", "id").values("id", "category_id", "price").iterator(
+        chunk_size=batch_size)
+    products, neighbours = [], {}
+    for product, candidates in price_windows(rows):
+        products.append(product)
+        neighbours[product["id"]] = candidates
+        if len(products) >= batch_size:
+            write(products, neighbours)
+            products, neighbours = [], {}
+    if products:
+        write(products, neighbours)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0007_cart_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price'], name='apiApp_prod_categor_5829ab_idx'),
+        ),
+        migrations.AddField(
+            model_name='similarproduct',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='apiApp.product'),
+        ),
+        migrations.AddField(
+            model_name='similarproduct',
+            name='similar',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='apiApp.product'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='similarproduct',
+            unique_together={('product', 'rank')},
+        ),
+        migrations.RunPython(populate_similar_products, migrations.RunPython.noop),
+    ]
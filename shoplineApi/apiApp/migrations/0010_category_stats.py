@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+# Calcula las estadísticas de las categorías existentes (mismo GROUP BY que
+# category_stats.category_aggregates, con los modelos históricos)
+def populate_category_stats(apps, schema_editor):
+    Category = apps.get_model("apiApp", "Category")
+    CategoryStats = apps.get_model("apiApp", "CategoryStats")
+    Product = apps.get_model("apiApp", "Product")
+    rows = (Product.objects.filter(category__isnull=False).order_by().values("category_id")
+            .annotate(product_count=Count("id"),
+                      featured_count=Count("id", filter=Q(featured=True)),
+                      min_price=Min("price"),
+                      max_price=Max("price"),
+                      total_reviews=Coalesce(Sum("rating__total_reviews"), 0),
+                      rating_sum=Coalesce(Sum("rating__rating_sum"), 0)))
+    aggregates = {row.pop("category_id"): row for row in rows}
+    CategoryStats.objects.bulk_create([CategoryStats(category_id=category_id, **aggregates.get(category_id, {}))
+                                       for category_id in Category.objects.values_list("id", flat=True)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0009_product_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('featured_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('total_reviews', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='apiApp.category')),
+            ],
+        ),
+        migrations.RunPython(populate_category_stats, migrations.RunPython.noop),
+    ]
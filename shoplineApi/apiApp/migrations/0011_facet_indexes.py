@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0010_category_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'featured'], name='apiApp_prod_categor_09b528_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productrating',
+            index=models.Index(fields=['average_rating'], name='apiApp_prod_average_0b5b46_idx'),
+        ),
+    ]
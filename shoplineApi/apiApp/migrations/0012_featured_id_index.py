@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0011_facet_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='apiApp_prod_feature_cb4e7a_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['featured', 'id'], name='apiApp_prod_feature_3be4e3_idx'),
+        ),
+    ]
@@ -1,8 +1,10 @@
 from django.conf import settings
 from django.db import models
-from django.utils.text import slugify
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
+from .slugs import save_with_unique_slug
+
 
 # ----------------------- USUARIO ----------------------- 
 class CustomUser(AbstractUser):
@@ -23,18 +25,9 @@ class Category(models.Model):
 
     # Genera un slug único basado en el nombre antes de guardar la categoría.
     def save(self, *args, **kwargs):
-
-        if not self.slug:
-            self.slug = slugify(self.name) #Convierte el texto en una versión amigable para URLs (reemplazar espacios por guines y todas las letras a minusculas)
-            unique_slug = self.slug
-            counter = 1
-            # Si ya existe un producto con ese slug 
-            if Product.objects.filter(slug=unique_slug).exists():
-                unique_slug = f'{self.slug}-{counter}'
-                counter += 1
-            self.slug = unique_slug
-        
-        super().save(*args, **kwargs)
+        if self.slug:
+            return super().save(*args, **kwargs)
+        return save_with_unique_slug(self, super().save, *args, **kwargs)
 
 # ----------------------- PRODUCTO ----------------------- 
 class Product(models.Model):
@@ -46,23 +39,77 @@ class Product(models.Model):
     featured = models.BooleanField(default=False)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, related_name="products",  blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["featured", "id"]),  # product_list (filtro y orden del cursor)
+            models.Index(fields=["category", "price"]),  # productos similares por rango de precio
+            models.Index(fields=["category", "featured"]),  # filtro y facet "featured" de category_detail
+        ]
+
     def __str__(self):
         return self.name
     
+    # Genera automáticamente un slug único basado en el nombre si no existe.
     def save(self, *args, **kwargs):
+        if self.slug:
+            return super().save(*args, **kwargs)
+        return save_with_unique_slug(self, super().save, *args, **kwargs)
+
+# ----------------------- ÍNDICE DE BÚSQUEDA -----------------------
+# Texto normalizado (sin tildes, minúsculas) de nombre, categoría y descripción
+# del producto. Sobre esta tabla se crea el índice FULLTEXT (MySQL) o FTS5 (SQLite).
+class ProductSearchDocument(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name="search_document")
+    document = models.TextField()
+
+    def __str__(self):
+        return f"Search document for {self.product_id}"
+
+
+# ----------------------- PRODUCTOS SIMILARES -----------------------
+# Top-K de productos similares de cada producto, precalculado (ver similarity.py)
+# para que el detalle lea K filas por índice en lugar de recorrer la categoría.
+class SimilarProduct(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="similar_links")
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="similar_to")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
 
-        # Genera automáticamente un slug único basado en el nombre si no existe.
+    class Meta:
+        unique_together = ["product", "rank"]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.similar_id} ({self.rank})"
+
+
+# "Los clientes también compraron": top-K de vecinos por compras y listas de
+# deseos en común (ver recommendations.py y el comando build_recommendations)
+class ProductRecommendation(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="recommendation_links")
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="recommended_for")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ["product", "rank"]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} ({self.rank})"
+
+
+# Cada ejecución guarda hasta qué líneas de orden y listas de deseos llegó, para
+# que la siguiente ejecución incremental procese solo lo nuevo
+class RecommendationRun(models.Model):
+    full = models.BooleanField(default=True)
+    last_order_item_id = models.BigIntegerField(default=0)
+    last_wishlist_id = models.BigIntegerField(default=0)
+    products_updated = models.PositiveIntegerField(default=0)
+    elapsed = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{'completa' if self.full else 'incremental'} {self.created_at:%Y-%m-%d %H:%M}"
 
-        if not self.slug:
-            self.slug = slugify(self.name)
-            unique_slug = self.slug
-            counter = 1
-            if Product.objects.filter(slug=unique_slug).exists():
-                unique_slug = f'{self.slug}-{counter}'
-                counter += 1
-            self.slug = unique_slug
-        
-        super().save(*args, **kwargs)
 
 # ----------------------- CARRITO -----------------------
 class Cart(models.Model):
@@ -70,6 +117,9 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["updated_at"])]  # purge_carts
+
     def __str__(self):
         return self.cart_code
 
@@ -80,6 +130,9 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="item")
     quantity = models.IntegerField(default=1)
 
+    class Meta:
+        indexes = [models.Index(fields=["cart", "product"])]  # product_in_cart, batch_update_cart
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in cart {self.cart.cart_code}"
     
@@ -111,19 +164,60 @@ class Review(models.Model):
     class Meta:
         unique_together = ["user", "product"]
         ordering = ["-created"]
+        indexes = [models.Index(fields=["product", "-created"])]  # reseñas del detalle de producto
 
 
 # ----------------------- VALORACIÓN DE PRODUCTO -----------------------
 class ProductRating(models.Model):
+    # Campo del contador por estrellas que corresponde a cada calificación
+    STAR_FIELDS = {
+        1: "poor_reviews",
+        2: "fair_reviews",
+        3: "good_reviews",
+        4: "very_good_reviews",
+        5: "excellent_reviews",
+    }
+
     product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='rating')
     average_rating = models.FloatField(default=0.0)
     total_reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    poor_reviews = models.PositiveIntegerField(default=0)
+    fair_reviews = models.PositiveIntegerField(default=0)
+    good_reviews = models.PositiveIntegerField(default=0)
+    very_good_reviews = models.PositiveIntegerField(default=0)
+    excellent_reviews = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["average_rating"])]  # filtro min_rating (facets.py)
 
     def __str__(self):
         return f"{self.product.name} - {self.average_rating} ({self.total_reviews} reviews)"
 
 
 
+# ----------------------- ESTADÍSTICAS DE CATEGORÍA -----------------------
+# Agregados de los productos de cada categoría para category_list. Los mantienen
+# las señales de Product y Review (ver category_stats.py) y el comando
+# rebuild_category_stats.
+class CategoryStats(models.Model):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, related_name="stats")
+    product_count = models.PositiveIntegerField(default=0)
+    featured_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    total_reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+
+    # Promedio de todas las reseñas de la categoría
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.total_reviews if self.total_reviews else 0.0
+
+    def __str__(self):
+        return f"{self.category.name} ({self.product_count} productos)"
+
+
 # ----------------------- LISTA DE DESEOS -----------------------
 class Wishlist(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="wishlists")
@@ -147,6 +241,12 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=[("Pending", "Pending"), ("Paid", "Paid")])
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["customer_email"]),  # get_orders
+            models.Index(fields=["created_at"]),  # export_orders por rango de fechas
+        ]
+
     def __str__(self):
         return f"Order {self.stripe_checkout_id} - {self.status}"
     
@@ -161,6 +261,33 @@ class OrderItem(models.Model):
     
 
 
+# ----------------------- EVENTO DE WEBHOOK -----------------------
+# Cola persistente de eventos de Stripe ya verificados. La vista del webhook
+# solo los guarda; el comando process_webhooks los procesa.
+class WebhookEvent(models.Model):
+    PENDING = "Pending"
+    PROCESSING = "Processing"
+    DONE = "Done"
+    DEAD = "Dead"
+    STATUS_CHOICES = [(PENDING, "Pending"), (PROCESSING, "Processing"), (DONE, "Done"), (DEAD, "Dead")]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} - {self.status}"
+
+
 # ----------------------- DIRECCIÓN DE CLIENTE -----------------------
 class CustomerAddress(models.Model):
     customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -0,0 +1,57 @@
+from .models import Order, OrderItem
+
+
+# Una fila por línea de orden, con los datos de la orden y del producto
+ORDER_FIELDS = ["order_id", "stripe_checkout_id", "created_at", "status", "currency", "amount", "customer_email",
+                "item_id", "product_id", "product_slug", "product_name", "quantity"]
+
+ITEM_VALUES = {
+    "order_id": "order_id",
+    "item_id": "id",
+    "product_id": "product_id",
+    "product_slug": "product__slug",
+    "product_name": "product__name",
+    "quantity": "quantity",
+}
+
+
+def orders_in_range(start=None, end=None, status=None):
+    orders = Order.objects.all()
+    if start:
+        orders = orders.filter(created_at__gte=start)
+    if end:
+        orders = orders.filter(created_at__lt=end)
+    if status:
+        orders = orders.filter(status=status)
+    return orders
+
+
+# Recorre las órdenes por bloques con paginación por clave (id > último id) y
+# trae las líneas de cada bloque con su producto en una sola consulta con JOIN.
+# La memoria queda acotada por chunk_size en cualquier motor (mysqlclient
+# carga en memoria el resultado completo de un cursor normal).
+def export_order_rows(orders=None, chunk_size=1000):
+    orders = (Order.objects.all() if orders is None else orders).order_by("id")
+    last_id = 0
+    while True:
+        chunk = {order["id"]: order for order in orders.filter(id__gt=last_id).values(
+            "id", "stripe_checkout_id", "created_at", "status", "currency", "amount", "customer_email")[:chunk_size]}
+        if not chunk:
+            return
+        last_id = max(chunk)
+
+        items = (OrderItem.objects.filter(order_id__in=chunk).order_by("order_id", "id")
+                 .values(*ITEM_VALUES.values()))
+        for item in items.iterator(chunk_size=chunk_size):
+            order = chunk[item["order_id"]]
+            row = {
+                "order_id": order["id"],
+                "stripe_checkout_id": order["stripe_checkout_id"],
+                "created_at": order["created_at"].isoformat(),
+                "status": order["status"],
+                "currency": order["currency"],
+                "amount": order["amount"],
+                "customer_email": order["customer_email"],
+            }
+            row.update((field, item[lookup]) for field, lookup in ITEM_VALUES.items())
+            yield row
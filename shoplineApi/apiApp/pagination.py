@@ -0,0 +1,51 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# Paginación por cursor (keyset) sobre columnas estables de los listados.
+# Si el cliente no envía "cursor" ni "page_size" la respuesta conserva la forma
+# de lista que espera el frontend actual, limitada a API_MAX_PAGE_SIZE y con la
+# siguiente página indicada en la cabecera "Link".
+class CatalogCursorPagination(CursorPagination):
+    page_size = settings.API_PAGE_SIZE
+    max_page_size = settings.API_MAX_PAGE_SIZE
+    page_size_query_param = "page_size"
+
+    def __init__(self, ordering="id"):
+        self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        query_params = request.query_params
+        self.legacy = (self.cursor_query_param not in query_params
+                       and self.page_size_query_param not in query_params)
+        if self.legacy:
+            self.page_size = self.max_page_size
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_next_link(self):
+        next_link = super().get_next_link()
+        if next_link and self.legacy:
+            next_link = replace_query_param(next_link, self.page_size_query_param, self.page_size)
+        return next_link
+
+    def get_links(self):
+        return {"next": self.get_next_link(), "previous": self.get_previous_link()}
+
+    def get_list_response(self, data):
+        if not self.legacy:
+            return self.get_paginated_response(data)
+
+        headers = {}
+        next_link = self.get_next_link()
+        if next_link:
+            headers["Link"] = f'<{next_link}>; rel="next"'
+        return Response(data, headers=headers)
+
+
+def paginated_list_response(request, queryset, serializer_class, ordering="id"):
+    paginator = CatalogCursorPagination(ordering)
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = serializer_class(page, many=True)
+    return paginator.get_list_response(serializer.data)
@@ -0,0 +1,81 @@
+import asyncio
+import weakref
+
+import stripe
+from django.conf import settings
+
+from .models import CartItem
+
+
+# ----------------------- SESIÓN DE CHECKOUT -----------------------
+
+VAT_FEE_CENTS = 500  # $5
+
+
+# Ítems del carrito con su producto en una sola consulta
+def checkout_items(cart):
+    return CartItem.objects.filter(cart=cart).select_related("product")
+
+
+def checkout_session_params(cart_code, email, cartitems):
+    line_items = [
+        {
+            'price_data': {
+                'currency': 'usd',
+                'product_data': {'name': item.product.name},
+                'unit_amount': int(item.product.price * 100),  # Amount in cents
+            },
+            'quantity': item.quantity,
+        }
+        for item in cartitems
+    ] + [
+        {
+            'price_data': {
+                'currency': 'usd',
+                'product_data': {'name': 'VAT Fee'},
+                'unit_amount': VAT_FEE_CENTS,
+            },
+            'quantity': 1,
+        }
+    ]
+    return {
+        "customer_email": email,
+        "payment_method_types": ['card'],
+        "line_items": line_items,
+        "mode": 'payment',
+        # "success_url": "https://nextshoppit.vercel.app/success",
+        # "cancel_url": "https://nextshoppit.vercel.app/cancel",
+        "success_url": "http://localhost:3000/success",
+        "cancel_url": "http://localhost:3000/failed",
+        "metadata": {"cart_code": cart_code},
+    }
+
+
+# ----------------------- CLIENTES HTTP -----------------------
+
+# Cliente síncrono (requests.Session reutiliza conexiones) con timeout y
+# reintentos para las vistas WSGI.
+def configure_stripe():
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.api_base = settings.STRIPE_API_BASE
+    stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+    stripe.default_http_client = stripe.RequestsClient(timeout=settings.STRIPE_TIMEOUT)
+
+
+# Cliente asíncrono (httpx.AsyncClient con keep-alive). Las conexiones de httpx
+# pertenecen a un event loop, así que se crea un cliente por loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def async_stripe_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY or "",
+            base_addresses={"api": settings.STRIPE_API_BASE},
+            max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+            http_client=stripe.HTTPXClient(timeout=settings.STRIPE_TIMEOUT),
+        )
+        _async_clients[loop] = client
+    return client
@@ -0,0 +1,213 @@
+import math
+import time
+from array import array
+
+import numpy as np
+from scipy import sparse
+from django.db import connection, transaction
+from django.db.models import Count, Max
+
+from .caching import bump_catalog_version, bump_product_version
+from .models import OrderItem, Product, ProductRecommendation, RecommendationRun, Wishlist
+
+
+# "Los clientes también compraron". Cada orden y cada lista de deseos (por
+# usuario) es una canasta; la matriz dispersa X (canastas x productos) tiene un
+# 1 por producto en la orden y sqrt(WISHLIST_WEIGHT) por producto deseado, así
+# X.T @ X suma las compras en común más WISHLIST_WEIGHT por cada deseo en común.
+# El puntaje es la similitud coseno con un término de contracción, para que dos
+# productos que coincidieron en una sola canasta no queden con puntaje 1.
+
+RECOMMENDATIONS_LIMIT = 8
+WISHLIST_WEIGHT = 0.5
+SHRINKAGE = 2.0
+# Productos (filas de X.T @ X) calculados por lote: acota la memoria del producto
+BATCH_SIZE = 1000
+# Filas leídas por viaje a la base de datos al cargar los pares
+CHUNK_SIZE = 20000
+
+
+# ----------------------- CARGA DE PARES -----------------------
+
+# Pares (canasta, producto) leídos con un cursor del servidor directamente a
+# arreglos compactos de enteros (16 bytes por par, sin objetos de Python)
+def load_pairs(queryset, basket_field, chunk_size=CHUNK_SIZE):
+    baskets, products = array("q"), array("q")
+    for basket_id, product_id in queryset.values_list(basket_field, "product_id").iterator(chunk_size=chunk_size):
+        baskets.append(basket_id)
+        products.append(product_id)
+    return np.frombuffer(baskets, dtype=np.int64), np.frombuffer(products, dtype=np.int64)
+
+
+def basket_matrix(baskets, products, product_index, value):
+    basket_ids, rows = np.unique(baskets, return_inverse=True)
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, np.searchsorted(product_index, products))),
+                               shape=(len(basket_ids), len(product_index)))
+    # Un producto repetido en la misma orden cuenta una vez
+    matrix.sum_duplicates()
+    matrix.data[:] = value
+    return matrix
+
+
+class BasketMatrix:
+
+    def __init__(self, order_pairs, wishlist_pairs, wishlist_weight=WISHLIST_WEIGHT):
+        self.product_index = np.unique(np.concatenate([order_pairs[1], wishlist_pairs[1]]))
+        blocks = [basket_matrix(*order_pairs, self.product_index, 1.0),
+                  basket_matrix(*wishlist_pairs, self.product_index, math.sqrt(wishlist_weight))]
+        self.matrix = sparse.vstack(blocks, format="csr")
+        # Productos x canastas, para leer las filas de un lote de productos
+        self.transposed = self.matrix.T.tocsr()
+        self.norms = np.sqrt(np.asarray(self.matrix.power(2).sum(axis=0)).ravel())
+
+    @property
+    def nbytes(self):
+        return sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in (self.matrix, self.transposed))
+
+    def positions(self, product_ids):
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        positions = np.searchsorted(self.product_index, product_ids)
+        found = positions < len(self.product_index)
+        found[found] = self.product_index[positions[found]] == product_ids[found]
+        return positions[found]
+
+    # Top-K de un lote de productos (posiciones en product_index), sin bucles de
+    # Python por producto: devuelve arreglos (producto, recomendado, rango, puntaje)
+    def top_k(self, positions, limit=RECOMMENDATIONS_LIMIT, norms=None):
+        norms = self.norms if norms is None else norms
+        block = (self.transposed[positions] @ self.matrix).tocoo()
+        rows, columns = block.row, block.col
+        scores = block.data / (norms[positions][rows] * norms[columns] + SHRINKAGE)
+
+        keep = positions[rows] != columns  # el producto no se recomienda a sí mismo
+        rows, columns, scores = rows[keep], columns[keep], scores[keep]
+
+        # Orden por (fila, -puntaje, id) y rango dentro de cada fila
+        order = np.lexsort((self.product_index[columns], -scores, rows))
+        rows, columns, scores = rows[order], columns[order], scores[order]
+        starts = np.searchsorted(rows, np.arange(len(positions)))
+        ranks = np.arange(len(rows)) - starts[rows]
+        top = ranks < limit
+        return (self.product_index[positions][rows[top]], self.product_index[columns[top]],
+                ranks[top], scores[top])
+
+
+# ----------------------- ESCRITURA -----------------------
+
+# Las filas se insertan con executemany a partir de los arreglos: crear un
+# objeto del modelo por fila costaba más que todo el cálculo de similitud
+def write_recommendations(product_ids, recommended_ids, ranks, scores, delete):
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(column) for column in ("product_id", "recommended_id", "rank", "score"))
+    sql = f"INSERT INTO {quote(ProductRecommendation._meta.db_table)} ({columns}) VALUES (%s, %s, %s, %s)"
+    rows = list(zip(product_ids.tolist(), recommended_ids.tolist(), ranks.tolist(), scores.tolist()))
+    with transaction.atomic():
+        delete.delete()
+        if rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+    return len(rows)
+
+
+def watermarks():
+    return (OrderItem.objects.aggregate(last=Max("id"))["last"] or 0,
+            Wishlist.objects.aggregate(last=Max("id"))["last"] or 0)
+
+
+def last_run():
+    return RecommendationRun.objects.order_by("-id").first()
+
+
+# ----------------------- RECÁLCULO COMPLETO -----------------------
+
+# Recalcula todo el catálogo. Los lotes recorren los productos en orden de id y
+# cada uno reemplaza el rango (id anterior, último id del lote], así también se
+# borran las filas de productos que ya no tienen compras ni deseos.
+def build_recommendations(limit=RECOMMENDATIONS_LIMIT, batch_size=BATCH_SIZE, wishlist_weight=WISHLIST_WEIGHT):
+    start = time.monotonic()
+    last_order_item_id, last_wishlist_id = watermarks()
+    data = BasketMatrix(load_pairs(OrderItem.objects.filter(id__lte=last_order_item_id), "order_id"),
+                        load_pairs(Wishlist.objects.filter(id__lte=last_wishlist_id), "user_id"),
+                        wishlist_weight)
+    loaded = time.monotonic()
+
+    links = 0
+    previous_id = 0
+    for batch_start in range(0, len(data.product_index), batch_size):
+        positions = np.arange(batch_start, min(batch_start + batch_size, len(data.product_index)))
+        last_id = int(data.product_index[positions[-1]])
+        links += write_recommendations(*data.top_k(positions, limit), ProductRecommendation.objects.filter(
+            product_id__gt=previous_id, product_id__lte=last_id))
+        previous_id = last_id
+    ProductRecommendation.objects.filter(product_id__gt=previous_id).delete()
+    bump_catalog_version()
+
+    run = RecommendationRun.objects.create(
+        full=True, last_order_item_id=last_order_item_id, last_wishlist_id=last_wishlist_id,
+        products_updated=len(data.product_index), elapsed=time.monotonic() - start)
+    return {"run": run, "pairs": data.matrix.nnz, "baskets": data.matrix.shape[0], "links": links,
+            "matrix_bytes": data.nbytes, "load_seconds": loaded - start}
+
+
+# ----------------------- ACTUALIZACIÓN INCREMENTAL -----------------------
+
+# Normas de las columnas (canastas por producto) calculadas en la base de datos
+# sobre todo el historial: en modo incremental X solo tiene algunas canastas.
+# Se cuentan filas y no canastas distintas (COUNT(*) se resuelve con el índice
+# de product_id): el checkout crea una línea por producto del carrito y una
+# lista de deseos no repite productos.
+def column_norms(product_index, last_order_item_id, last_wishlist_id, wishlist_weight):
+    squares = np.zeros(len(product_index))
+    for queryset, weight in ((OrderItem.objects.filter(id__lte=last_order_item_id), 1.0),
+                             (Wishlist.objects.filter(id__lte=last_wishlist_id), wishlist_weight)):
+        counts = np.array(queryset.values("product_id").annotate(baskets=Count("*"))
+                          .order_by().values_list("product_id", "baskets"), dtype=np.int64).reshape(-1, 2)
+        positions = np.searchsorted(product_index, counts[:, 0])
+        found = positions < len(product_index)
+        found[found] = product_index[positions[found]] == counts[found, 0]
+        squares[positions[found]] += weight * counts[found, 1]
+    return np.sqrt(squares)
+
+
+# Recalcula solo los productos de las órdenes y listas de deseos nuevas desde
+# la última ejecución. Las compras en común de esos productos solo pueden estar
+# en canastas que los contienen, así que basta cargar esas canastas. Los
+# puntajes con que aparecen en las listas de otros productos se corrigen en la
+# próxima ejecución completa.
+def update_recommendations(limit=RECOMMENDATIONS_LIMIT, batch_size=BATCH_SIZE, wishlist_weight=WISHLIST_WEIGHT):
+    previous = last_run()
+    if previous is None:
+        return build_recommendations(limit, batch_size, wishlist_weight)
+
+    start = time.monotonic()
+    last_order_item_id, last_wishlist_id = watermarks()
+    new_items = OrderItem.objects.filter(id__gt=previous.last_order_item_id, id__lte=last_order_item_id)
+    new_wishes = Wishlist.objects.filter(id__gt=previous.last_wishlist_id, id__lte=last_wishlist_id)
+    affected = set(new_items.values_list("product_id", flat=True)) | set(new_wishes.values_list("product_id", flat=True))
+
+    links = pairs = baskets = matrix_bytes = 0
+    loaded = start
+    if affected:
+        orders = OrderItem.objects.filter(id__lte=last_order_item_id, order_id__in=OrderItem.objects.filter(
+            id__lte=last_order_item_id, product_id__in=affected).values("order_id"))
+        users = Wishlist.objects.filter(id__lte=last_wishlist_id, user_id__in=Wishlist.objects.filter(
+            id__lte=last_wishlist_id, product_id__in=affected).values("user_id"))
+        data = BasketMatrix(load_pairs(orders, "order_id"), load_pairs(users, "user_id"), wishlist_weight)
+        norms = column_norms(data.product_index, last_order_item_id, last_wishlist_id, wishlist_weight)
+        loaded = time.monotonic()
+
+        positions = data.positions(sorted(affected))
+        for batch_start in range(0, len(positions), batch_size):
+            batch = positions[batch_start:batch_start + batch_size]
+            links += write_recommendations(*data.top_k(batch, limit, norms), ProductRecommendation.objects.filter(
+                product_id__in=[int(product_id) for product_id in data.product_index[batch]]))
+        for slug in Product.objects.filter(id__in=affected).values_list("slug", flat=True):
+            bump_product_version(slug)
+        pairs, baskets, matrix_bytes = data.matrix.nnz, data.matrix.shape[0], data.nbytes
+
+    run = RecommendationRun.objects.create(
+        full=False, last_order_item_id=last_order_item_id, last_wishlist_id=last_wishlist_id,
+        products_updated=len(affected), elapsed=time.monotonic() - start)
+    return {"run": run, "pairs": pairs, "baskets": baskets, "links": links,
+            "matrix_bytes": matrix_bytes, "load_seconds": loaded - start}
+
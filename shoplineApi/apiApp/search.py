@@ -0,0 +1,168 @@
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+from django.utils.module_loading import import_string
+
+from .models import Product, ProductSearchDocument
+
+
+FTS_TABLE = "apiApp_productsearch_fts"
+
+TOKEN_RE = re.compile(r"\w+")
+
+# InnoDB no indexa las palabras de menos de innodb_ft_min_token_size letras (3
+# por defecto) ni su lista de stopwords, y en modo booleano un "+palabra" que
+# no está en el índice deja la búsqueda sin resultados: esas palabras se
+# buscan con LIKE sobre el documento.
+FULLTEXT_MIN_TOKEN_SIZE = 3
+FULLTEXT_STOPWORDS = {
+    "a", "about", "an", "are", "as", "at", "be", "by", "com", "de", "en", "for", "from", "how", "i", "in", "is",
+    "it", "la", "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "who", "will",
+    "with", "und", "www",
+}
+
+
+# Minúsculas y sin tildes: "Cámara" -> "camara". Se aplica tanto a los
+# documentos indexados como a las consultas, así la búsqueda no depende de la
+# intercalación (collation) de la base de datos.
+def normalize_search_text(text):
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def search_tokens(query):
+    return TOKEN_RE.findall(normalize_search_text(query))
+
+
+def build_document(product):
+    category_name = product.category.name if product.category_id else ""
+    return normalize_search_text(" ".join([product.name, category_name, product.description]))
+
+
+# ----------------------- BACKENDS -----------------------
+# Cada backend mantiene el índice a partir de ProductSearchDocument y devuelve
+# los ids de los productos ordenados por relevancia.
+class BaseSearchBackend:
+
+    def index_products(self, products, batch_size=500):
+        products = products.select_related("category").only("name", "description", "category__name")
+        indexed = 0
+        batch = []
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append(ProductSearchDocument(product=product, document=build_document(product)))
+            if len(batch) >= batch_size:
+                indexed += self.write_documents(batch)
+                batch = []
+        if batch:
+            indexed += self.write_documents(batch)
+        return indexed
+
+    def write_documents(self, documents):
+        kwargs = {"update_conflicts": True, "update_fields": ["document"]}
+        if connection.features.supports_update_conflicts_with_target:
+            kwargs["unique_fields"] = ["product"]
+        ProductSearchDocument.objects.bulk_create(documents, **kwargs)
+        return len(documents)
+
+    def remove_products(self, product_ids):
+        ProductSearchDocument.objects.filter(product_id__in=product_ids).delete()
+
+    def search(self, query, limit):
+        tokens = search_tokens(query)
+        if not tokens:
+            return []
+        documents = ProductSearchDocument.objects.all()
+        for token in tokens:
+            documents = documents.filter(document__contains=token)
+        return list(documents.order_by("product_id").values_list("product_id", flat=True)[:limit])
+
+
+class MySQLSearchBackend(BaseSearchBackend):
+    # Índice FULLTEXT sobre ProductSearchDocument.document (migración 0003)
+
+    def search(self, query, limit):
+        indexed, unindexed = fulltext_terms(search_tokens(query))
+        if not indexed:
+            # Solo palabras cortas o stopwords: búsqueda por subcadena del backend base
+            return super().search(query, limit)
+        # Modo booleano con prefijos: cada palabra es obligatoria y admite autocompletado
+        against = " ".join(f"+{token}*" for token in indexed)
+        like = [f"%{token}%".replace("_", r"\_") for token in unindexed]
+        table = ProductSearchDocument._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT product_id FROM {table} "
+                f"WHERE MATCH(document) AGAINST(%s IN BOOLEAN MODE)"
+                + "".join(" AND document LIKE %s" for _ in like)
+                + f" ORDER BY MATCH(document) AGAINST(%s IN BOOLEAN MODE) DESC, product_id "
+                f"LIMIT %s",
+                [against, *like, against, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+# Separa las palabras que están en el índice FULLTEXT de las que no
+def fulltext_terms(tokens):
+    indexed, unindexed = [], []
+    for token in tokens:
+        if len(token) >= FULLTEXT_MIN_TOKEN_SIZE and token not in FULLTEXT_STOPWORDS:
+            indexed.append(token)
+        else:
+            unindexed.append(token)
+    return indexed, unindexed
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    # Tabla virtual FTS5 (migración 0003) cuyo rowid es el id del producto
+
+    def write_documents(self, documents):
+        super().write_documents(documents)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, document) VALUES (%s, %s)",
+                [(document.product_id, document.document) for document in documents],
+            )
+        return len(documents)
+
+    def remove_products(self, product_ids):
+        super().remove_products(product_ids)
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+    def search(self, query, limit):
+        tokens = search_tokens(query)
+        if not tokens:
+            return []
+        match = " ".join(f'"{token}"*' for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}), rowid LIMIT %s",
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS_BY_VENDOR = {
+    "mysql": MySQLSearchBackend,
+    "sqlite": SQLiteSearchBackend,
+}
+
+
+def get_search_backend():
+    backend_path = getattr(settings, "PRODUCT_SEARCH_BACKEND", None)
+    if backend_path:
+        return import_string(backend_path)()
+    return BACKENDS_BY_VENDOR.get(connection.vendor, BaseSearchBackend)()
+
+
+# Productos de la búsqueda anotados con su posición en el ranking ("relevance"),
+# columna estable sobre la que pagina el cursor.
+def ranked_products(query, limit):
+    product_ids = get_search_backend().search(query, limit)
+    ranking = Case(*[When(id=pk, then=Value(position)) for position, pk in enumerate(product_ids)],
+                   default=Value(len(product_ids)), output_field=IntegerField())
+    return Product.objects.filter(id__in=product_ids).annotate(relevance=ranking)
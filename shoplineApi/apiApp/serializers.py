@@ -1,11 +1,19 @@
 from rest_framework import serializers 
 from django.contrib.auth import get_user_model
 from .models import Cart, CartItem, CustomerAddress, Order, OrderItem, Product, Category, ProductRating, Review, Wishlist
+from .instrumentation import TimedSerializerMixin
+from .similarity import SIMILAR_PRODUCTS_LIMIT
 
 
+# Base de los serializadores de la API: el tiempo que pasan serializando se
+# reporta en Server-Timing y /metrics (ver instrumentation.py)
+class ModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    pass
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+
+
+class ProductListSerializer(ModelSerializer):
     class Meta:
         model = Product
         fields = ["id", "name", "slug", "image", "price"]
@@ -13,21 +21,21 @@ class ProductListSerializer(serializers.ModelSerializer):
 
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ["id", "email", "username", "first_name", "last_name", "profile_picture_url"]
 
     
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(ModelSerializer):
     user = UserSerializer(read_only=True)
     class Meta:
         model = Review 
         fields = ["id", "user", "rating", "review", "created", "updated"]
 
 
-class ProductRatingSerializer(serializers.ModelSerializer):
+class ProductRatingSerializer(ModelSerializer):
     class Meta:
         model = ProductRating 
         fields =[ "id", "average_rating", "total_reviews"]
@@ -36,7 +44,13 @@ class ProductRatingSerializer(serializers.ModelSerializer):
 
 
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+# Lee el top-K precalculado (SimilarProduct) por el índice (product, rank)
+def similar_products_queryset(product):
+    return (Product.objects.filter(similar_to__product_id=product.id)
+            .order_by("similar_to__rank")[:SIMILAR_PRODUCTS_LIMIT])
+
+
+class ProductDetailSerializer(ModelSerializer):
 
     # Newly Added
 
@@ -60,45 +74,72 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     # Newly Added
 
     def get_similar_products(self, product):
-        products = Product.objects.filter(category=product.category).exclude(id=product.id)
-        serializer = ProductListSerializer(products, many=True)
+        serializer = ProductListSerializer(similar_products_queryset(product), many=True)
         return serializer.data
-    
+
+    # El histograma se lee de los contadores desnormalizados de ProductRating
+    def _review_count(self, product, field):
+        rating = getattr(product, "rating", None)
+        return getattr(rating, field) if rating else 0
+
     def get_poor_review(self, product):
-        poor_review_count = product.reviews.filter(rating=1).count()
-        return poor_review_count
+        return self._review_count(product, "poor_reviews")
     
     def get_fair_review(self, product):
-        fair_review_count = product.reviews.filter(rating=2).count()
-        return fair_review_count
+        return self._review_count(product, "fair_reviews")
     
     def get_good_review(self, product):
-        good_review_count = product.reviews.filter(rating=3).count()
-        return good_review_count
+        return self._review_count(product, "good_reviews")
     
     def get_very_good_review(self, product):
-        very_good_review_count = product.reviews.filter(rating=4).count()
-        return very_good_review_count
+        return self._review_count(product, "very_good_reviews")
     
     def get_excellent_review(self, product):
-        excellent_review_count = product.reviews.filter(rating=5).count()
-        return excellent_review_count
+        return self._review_count(product, "excellent_reviews")
+
 
+class CategoryListSerializer(ModelSerializer):
+    product_count = serializers.SerializerMethodField()
+    featured_count = serializers.SerializerMethodField()
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, source="stats.min_price", read_only=True)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, source="stats.max_price", read_only=True)
+    average_rating = serializers.SerializerMethodField()
 
-class CategoryListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ["id", "name", "image", "slug"]
+        fields = ["id", "name", "image", "slug", "product_count", "featured_count", "min_price", "max_price",
+                  "average_rating"]
+
+    # Los agregados se leen de CategoryStats (select_related("stats") en la vista)
+    def _stat(self, category, field, default):
+        stats = getattr(category, "stats", None)
+        return getattr(stats, field) if stats else default
+
+    def get_product_count(self, category):
+        return self._stat(category, "product_count", 0)
 
-class CategoryDetailSerializer(serializers.ModelSerializer):
-    products = ProductListSerializer(many=True, read_only=True)
+    def get_featured_count(self, category):
+        return self._stat(category, "featured_count", 0)
+
+    def get_average_rating(self, category):
+        return self._stat(category, "average_rating", 0.0)
+
+class CategoryDetailSerializer(ModelSerializer):
+    products = serializers.SerializerMethodField()
     class Meta:
         model = Category
         fields = ["id", "name", "image", "products"]
 
+    # La vista puede enviar en el contexto la página de productos ya paginada
+    def get_products(self, category):
+        products = self.context.get("products")
+        if products is None:
+            products = category.products.all()
+        return ProductListSerializer(products, many=True).data
+
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(ModelSerializer):
     product = ProductListSerializer(read_only=True)
     sub_total = serializers.SerializerMethodField()
     class Meta:
@@ -106,13 +147,17 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ["id", "product", "quantity", "sub_total"]
 
     
+    # sub_total, cart_total y num_of_items llegan anotados desde la consulta
+    # (ver views.cart_queryset); si no, se calculan en Python.
     def get_sub_total(self, cartitem):
-        total = cartitem.product.price * cartitem.quantity 
+        total = getattr(cartitem, "sub_total", None)
+        if total is None:
+            total = cartitem.product.price * cartitem.quantity 
         return total
 
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(ModelSerializer):
     cartitems = CartItemSerializer(read_only=True, many=True)
     cart_total = serializers.SerializerMethodField()
     class Meta:
@@ -120,18 +165,22 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ["id", "cart_code", "cartitems", "cart_total"]
 
     def get_cart_total(self, cart):
+        if hasattr(cart, "cart_total"):
+            return cart.cart_total or 0
         items = cart.cartitems.all()
         total = sum([item.quantity * item.product.price for item in items])
         return total
     
 
-class CartStatSerializer(serializers.ModelSerializer): 
+class CartStatSerializer(ModelSerializer): 
     total_quantity = serializers.SerializerMethodField()
     class Meta:
         model = Cart 
         fields = ["id", "cart_code", "total_quantity"]
 
     def get_total_quantity(self, cart):
+        if hasattr(cart, "num_of_items"):
+            return cart.num_of_items or 0
         items = cart.cartitems.all()
         total = sum([item.quantity for item in items])
         return total
@@ -140,7 +189,7 @@ class CartStatSerializer(serializers.ModelSerializer):
 
 
 
-class WishlistSerializer(serializers.ModelSerializer):
+class WishlistSerializer(ModelSerializer):
     user = UserSerializer(read_only=True)
     product = ProductListSerializer(read_only=True)
     class Meta:
@@ -151,34 +200,56 @@ class WishlistSerializer(serializers.ModelSerializer):
 
 # NEW ADDED 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(ModelSerializer):
     product = ProductListSerializer(read_only=True)
     class Meta:
         model = OrderItem
         fields = ["id", "quantity", "product"]
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSummarySerializer(ModelSerializer):
+    item_count = serializers.SerializerMethodField()
+    total_quantity = serializers.SerializerMethodField()
+    class Meta:
+        model = Order
+        fields = ["id", "stripe_checkout_id", "amount", "currency", "status", "created_at", "item_count", "total_quantity"]
+
+    # item_count y total_quantity llegan anotados desde la consulta
+    # (ver views.order_queryset); si no, se calculan en Python.
+    def get_item_count(self, order):
+        if hasattr(order, "item_count"):
+            return order.item_count
+        return len(order.items.all())
+
+    def get_total_quantity(self, order):
+        if hasattr(order, "total_quantity"):
+            return order.total_quantity or 0
+        return sum(item.quantity for item in order.items.all())
+
+
+class OrderSerializer(OrderSummarySerializer):
     items = OrderItemSerializer(read_only=True, many=True)
     class Meta:
         model = Order 
-        fields = ["id", "stripe_checkout_id", "amount", "items", "status", "created_at"]
+        fields = ["id", "stripe_checkout_id", "amount", "items", "status", "created_at", "item_count", "total_quantity"]
 
 
 
-class CustomerAddressSerializer(serializers.ModelSerializer):
+class CustomerAddressSerializer(ModelSerializer):
     customer = UserSerializer(read_only=True)
     class Meta:
         model = CustomerAddress
         fields = "__all__"
 
 
-class SimpleCartSerializer(serializers.ModelSerializer):
+class SimpleCartSerializer(ModelSerializer):
     num_of_items = serializers.SerializerMethodField()
     class Meta:
         model = Cart 
         fields = ["id", "cart_code", "num_of_items"]
 
     def get_num_of_items(self, cart):
+        if hasattr(cart, "num_of_items"):
+            return cart.num_of_items or 0
         num_of_items = sum([item.quantity for item in cart.cartitems.all()])
         return num_of_items
@@ -1,37 +1,208 @@
-from django.db.models.signals import post_save, post_delete 
+from django.db import transaction
+from django.utils import timezone
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from django.db.models import Avg
+from django.db.models import Case, F, FloatField, QuerySet, Value, When
+from django.db.models.functions import Cast
 
-from apiApp.models import ProductRating, Review
+from apiApp.models import Cart, CartItem, Category, Product, ProductRating, ProductSearchDocument, Review
+from apiApp.search import build_document, get_search_backend
+from apiApp.caching import bump_catalog_version, bump_product_version
+from apiApp.similarity import listing_products, rebuild_in_batches, refresh_similar_products
+from apiApp.category_stats import apply_category_rating_delta, refresh_category_stats
 
 
+# Aplica a la valoración del producto un delta de contadores por estrellas y de
+# suma de calificaciones con un único UPDATE atómico basado en F().
+def apply_rating_delta(product_id, star_deltas, sum_delta, create=True):
+    count_delta = sum(star_deltas.values())
+    new_total = F("total_reviews") + count_delta
+    new_sum = F("rating_sum") + sum_delta
+
+    # average_rating va primero: MySQL evalúa las asignaciones de izquierda a
+    # derecha, así todas las columnas se leen con su valor anterior.
+    updates = {
+        "average_rating": Case(
+            When(total_reviews__lte=-count_delta, then=Value(0.0)),
+            default=Cast(new_sum, FloatField()) / Cast(new_total, FloatField()),
+            output_field=FloatField(),
+        ),
+        "total_reviews": new_total,
+        "rating_sum": new_sum,
+    }
+    for field, delta in star_deltas.items():
+        updates[field] = F(field) + delta
+
+    ratings = ProductRating.objects.filter(product_id=product_id)
+    if not ratings.update(**updates) and create:
+        ProductRating.objects.get_or_create(product_id=product_id)
+        ratings.update(**updates)
 
-@receiver(post_save, sender=Review)
-def update_product_rating_on_save(sender, instance, **kwargs):
-    product = instance.product 
-    reviews = product.reviews.all()
-    total_reviews = reviews.count() 
 
-    review_average = reviews.aggregate(Avg("rating"))["rating__avg"] or 0.0
+@receiver(post_init, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    # Guarda la calificación cargada para calcular el delta al actualizar la reseña
+    instance._saved_rating = instance.rating if instance.pk else None
+
+
+@receiver(post_save, sender=Review)
+def update_product_rating_on_save(sender, instance, created, **kwargs):
+    rating = int(instance.rating)
+    previous = instance._saved_rating
 
+    if created or previous is None:
+        apply_rating_delta(instance.product_id, {ProductRating.STAR_FIELDS[rating]: 1}, rating)
+        apply_category_rating_delta(instance.product.category_id, 1, rating)
+    elif int(previous) != rating:
+        previous = int(previous)
+        apply_rating_delta(instance.product_id,
+                           {ProductRating.STAR_FIELDS[previous]: -1, ProductRating.STAR_FIELDS[rating]: 1},
+                           rating - previous)
+        apply_category_rating_delta(instance.product.category_id, 0, rating - previous)
 
-    product_rating, created = ProductRating.objects.get_or_create(product=product)
-    product_rating.average_rating = review_average 
-    product_rating.total_reviews = total_reviews 
-    product_rating.save()
+    instance._saved_rating = rating
 
 
 
 @receiver(post_delete, sender=Review)
 def update_product_rating_on_delete(sender, instance, **kwargs):
-    product = instance.product 
-    reviews = product.reviews.all()
-    total_reviews = reviews.count() 
+    rating = int(instance._saved_rating or instance.rating)
+    # Si el producto se está eliminando su valoración ya no existe: no se recrea
+    apply_rating_delta(instance.product_id, {ProductRating.STAR_FIELDS[rating]: -1}, -rating, create=False)
+    apply_category_rating_delta(instance.product.category_id, -1, -rating)
+
+
+
+# ----------------------- ÍNDICE DE BÚSQUEDA -----------------------
+# Mantiene incrementalmente el documento de búsqueda de cada producto.
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, **kwargs):
+    document = ProductSearchDocument(product=instance, document=build_document(instance))
+    get_search_backend().write_documents([document])
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.id])
+
+
+@receiver(post_init, sender=Category)
+def remember_category_name(sender, instance, **kwargs):
+    # Se lee __dict__ para no cargar campos diferidos (only/defer) desde la base
+    instance._saved_name = instance.__dict__.get("name") if instance.pk else None
+
+
+# El documento de cada producto incluye el nombre de su categoría: se
+# reindexan sus productos (al confirmar la transacción) solo si cambió
+@receiver(post_save, sender=Category)
+def reindex_category_products_on_save(sender, instance, created, **kwargs):
+    if not created and instance._saved_name != instance.name:
+        category_id = instance.id
+        transaction.on_commit(
+            lambda: get_search_backend().index_products(Product.objects.filter(category_id=category_id)))
+    instance._saved_name = instance.name
+
+
+@receiver(pre_delete, sender=Category)
+def reindex_category_products_on_delete(sender, instance, **kwargs):
+    # Los productos quedan sin categoría (SET_NULL) sin emitir post_save
+    product_ids = list(instance.products.values_list("id", flat=True))
+    if product_ids:
+        transaction.on_commit(
+            lambda: get_search_backend().index_products(Product.objects.filter(id__in=product_ids)))
+
+
+
+# ----------------------- PRODUCTOS SIMILARES -----------------------
+# El top-K solo depende de la categoría, el precio y las compras: se recalcula
+# (al confirmar la transacción) cuando cambian la categoría o el precio.
+
+def similarity_fields(instance):
+    # Se lee __dict__ para no cargar campos diferidos (only/defer) desde la base
+    return instance.__dict__.get("category_id"), instance.__dict__.get("price")
+
+
+@receiver(post_init, sender=Product)
+def remember_similarity_fields(sender, instance, **kwargs):
+    instance._saved_similarity = similarity_fields(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def refresh_similar_on_save(sender, instance, created, **kwargs):
+    if created or instance._saved_similarity != similarity_fields(instance):
+        product_id = instance.id
+        transaction.on_commit(lambda: refresh_similar_products([product_id]))
+    instance._saved_similarity = similarity_fields(instance)
+
+
+@receiver(pre_delete, sender=Product)
+def refresh_similar_on_delete(sender, instance, **kwargs):
+    # Las filas del producto se eliminan en cascada; se recalculan los que lo listaban
+    product_ids = listing_products([instance.id]) - {instance.id}
+    if product_ids:
+        transaction.on_commit(lambda: rebuild_in_batches(product_ids))
+
+
+
+# ----------------------- ESTADÍSTICAS DE CATEGORÍA -----------------------
+# Se recalculan (al confirmar la transacción) las categorías anterior y nueva
+# cuando cambian la categoría, el precio o el destacado de un producto.
+
+def category_stats_fields(instance):
+    return (instance.__dict__.get("category_id"), instance.__dict__.get("price"),
+            instance.__dict__.get("featured"))
+
+
+@receiver(post_init, sender=Product)
+def remember_category_stats_fields(sender, instance, **kwargs):
+    instance._saved_category_stats = category_stats_fields(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def refresh_category_stats_on_save(sender, instance, created, **kwargs):
+    fields = category_stats_fields(instance)
+    if created or instance._saved_category_stats != fields:
+        category_ids = {fields[0], (instance._saved_category_stats or (None,))[0]} - {None}
+        if category_ids:
+            transaction.on_commit(lambda: refresh_category_stats(category_ids))
+    instance._saved_category_stats = fields
+
+
+@receiver(post_delete, sender=Product)
+def refresh_category_stats_on_delete(sender, instance, **kwargs):
+    category_id = instance.category_id
+    if category_id is not None:
+        transaction.on_commit(lambda: refresh_category_stats([category_id]))
+
+
+# ----------------------- CACHÉ DEL CATÁLOGO -----------------------
+# Invalida las respuestas cacheadas incrementando sus versiones.
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=ProductRating)
+@receiver(post_delete, sender=ProductRating)
+def invalidate_product_cache(sender, instance, **kwargs):
+    bump_product_version(instance.product.slug)
+
 
-    review_average = reviews.aggregate(Avg("rating"))["rating__avg"] or 0.0
 
+# ----------------------- CARRITO -----------------------
+# Cambiar los ítems actualiza Cart.updated_at (validador de las peticiones condicionales)
 
-    product_rating, created = ProductRating.objects.get_or_create(product=product)
-    product_rating.average_rating = review_average 
-    product_rating.total_reviews = total_reviews 
-    product_rating.save()
\ No newline at end of file
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def touch_cart(sender, instance, origin=None, **kwargs):
+    # Si se está eliminando el carrito completo (o un queryset de carritos) no hay nada que actualizar
+    if isinstance(origin, Cart) or (isinstance(origin, QuerySet) and origin.model is Cart):
+        return
+    Cart.objects.filter(id=instance.cart_id).update(updated_at=timezone.now())
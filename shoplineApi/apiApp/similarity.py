@@ -0,0 +1,188 @@
+import math
+from collections import defaultdict, deque
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .caching import bump_catalog_version, bump_product_version
+from .models import OrderItem, Product, SimilarProduct
+
+
+# Máximo de productos similares guardados (y devueltos) por producto
+SIMILAR_PRODUCTS_LIMIT = 8
+# Candidatos de la misma categoría a cada lado del precio del producto
+PRICE_NEIGHBOURS = 2 * SIMILAR_PRODUCTS_LIMIT
+# Candidatos comprados junto con el producto
+COPURCHASE_CANDIDATES = 2 * SIMILAR_PRODUCTS_LIMIT
+
+# Pesos del puntaje de similitud
+CATEGORY_WEIGHT = 1.0
+PRICE_WEIGHT = 0.5
+COPURCHASE_WEIGHT = 1.0
+# Cada banda de precio duplica a la anterior: 10-20, 20-40, 40-80...
+PRICE_BAND_RATIO = 2
+
+
+def price_band(price):
+    if price is None or price <= 0:
+        return None
+    return math.floor(math.log(float(price), PRICE_BAND_RATIO))
+
+
+def price_score(band, other_band):
+    if band is None or other_band is None:
+        return 0.0
+    return {0: 1.0, 1: 0.5}.get(abs(band - other_band), 0.0)
+
+
+def similarity_score(product, candidate, copurchases):
+    score = 0.0
+    if product["category_id"] is not None and product["category_id"] == candidate["category_id"]:
+        score += CATEGORY_WEIGHT
+    score += PRICE_WEIGHT * price_score(price_band(product["price"]), price_band(candidate["price"]))
+    score += COPURCHASE_WEIGHT * math.log1p(copurchases)
+    return score
+
+
+# Productos de la misma categoría más cercanos en precio, por encima y por
+# debajo. Cada consulta recorre el índice (category, price) y lee pocas filas.
+def price_neighbours(product):
+    if product["category_id"] is None:
+        return []
+    same_category = (Product.objects.filter(category_id=product["category_id"]).exclude(id=product["id"])
+                     .values("id", "category_id", "price"))
+    above = same_category.filter(price__gte=product["price"]).order_by("price", "id")[:PRICE_NEIGHBOURS]
+    below = same_category.filter(price__lt=product["price"]).order_by("-price", "-id")[:PRICE_NEIGHBOURS]
+    return [*above, *below]
+
+
+# Veces que cada par de productos aparece en la misma orden, para un lote de
+# productos, con una sola consulta (OrderItem x OrderItem por order_id)
+def copurchase_counts(product_ids):
+    pairs = (OrderItem.objects.filter(product_id__in=product_ids)
+             .values("product_id", other_id=F("order__items__product_id"))
+             .annotate(orders=Count("order_id", distinct=True))
+             .order_by())
+    counts = defaultdict(dict)
+    for pair in pairs:
+        if pair["other_id"] != pair["product_id"]:
+            counts[pair["product_id"]][pair["other_id"]] = pair["orders"]
+    return counts
+
+
+def top_similar(product, candidates, copurchases):
+    scored = []
+    for candidate in candidates.values():
+        score = similarity_score(product, candidate, copurchases.get(candidate["id"], 0))
+        distance = abs(candidate["price"] - product["price"])
+        scored.append((-score, distance, candidate["id"], score))
+    scored.sort()
+    return [(candidate_id, score) for _, _, candidate_id, score in scored[:SIMILAR_PRODUCTS_LIMIT]]
+
+
+# Calcula el top-K de un lote de productos (con sus vecinos de precio ya
+# resueltos) y reemplaza sus filas
+def write_similar_products(products, neighbours, bump=True):
+    copurchases = copurchase_counts([product["id"] for product in products])
+
+    # Datos de los productos comprados juntos (una consulta para todo el lote)
+    copurchased_ids = set()
+    for product in products:
+        top = sorted(copurchases[product["id"]].items(), key=lambda item: -item[1])[:COPURCHASE_CANDIDATES]
+        copurchases[product["id"]] = dict(top)
+        copurchased_ids.update(copurchases[product["id"]])
+    copurchased = {candidate["id"]: candidate for candidate in
+                   Product.objects.filter(id__in=copurchased_ids).values("id", "category_id", "price")}
+
+    links = []
+    for product in products:
+        candidates = {candidate["id"]: candidate for candidate in neighbours[product["id"]]}
+        candidates.update((candidate_id, copurchased[candidate_id])
+                          for candidate_id in copurchases[product["id"]] if candidate_id in copurchased)
+        for rank, (similar_id, score) in enumerate(top_similar(product, candidates, copurchases[product["id"]])):
+            links.append(SimilarProduct(product_id=product["id"], similar_id=similar_id, rank=rank, score=score))
+
+    with transaction.atomic():
+        SimilarProduct.objects.filter(product_id__in=[product["id"] for product in products]).delete()
+        SimilarProduct.objects.bulk_create(links)
+    if bump:
+        for product in products:
+            bump_product_version(product["slug"])
+    return len(products)
+
+
+def rebuild_similar_products(product_ids):
+    products = list(Product.objects.filter(id__in=product_ids).values("id", "slug", "category_id", "price"))
+    neighbours = {product["id"]: price_neighbours(product) for product in products}
+    return write_similar_products(products, neighbours)
+
+
+# Recorre el catálogo ordenado por (categoría, precio) una sola vez y entrega
+# cada producto con sus PRICE_NEIGHBOURS vecinos de cada lado, usando una
+# ventana deslizante en memoria en lugar de dos consultas por producto.
+def price_windows(rows):
+    for category_id, group in groupby(rows, key=itemgetter("category_id")):
+        if category_id is None:
+            for row in group:
+                yield row, []
+            continue
+
+        window = deque()
+        start = emitted = 0  # posiciones (en la categoría) de window[0] y del próximo producto
+
+        def emit(position):
+            low = max(start, position - PRICE_NEIGHBOURS)
+            high = min(start + len(window), position + PRICE_NEIGHBOURS + 1)
+            return window[position - start], [window[i - start] for i in range(low, high) if i != position]
+
+        for row in group:
+            window.append(row)
+            while emitted + PRICE_NEIGHBOURS < start + len(window):
+                yield emit(emitted)
+                emitted += 1
+                while start < emitted - PRICE_NEIGHBOURS:
+                    window.popleft()
+                    start += 1
+        while emitted < start + len(window):
+            yield emit(emitted)
+            emitted += 1
+
+
+def rebuild_all_similar_products(batch_size=1000):
+    rows = (Product.objects.order_by("category_id", "price", "id")
+            .values("id", "slug", "category_id", "price").iterator(chunk_size=batch_size))
+    rebuilt = 0
+    products, neighbours = [], {}
+    for product, candidates in price_windows(rows):
+        products.append(product)
+        neighbours[product["id"]] = candidates
+        if len(products) >= batch_size:
+            rebuilt += write_similar_products(products, neighbours, bump=False)
+            products, neighbours = [], {}
+    if products:
+        rebuilt += write_similar_products(products, neighbours, bump=False)
+    bump_catalog_version()
+    return rebuilt
+
+
+def rebuild_in_batches(product_ids, batch_size=200):
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), batch_size):
+        rebuild_similar_products(product_ids[start:start + batch_size])
+
+
+def listing_products(product_ids):
+    return set(SimilarProduct.objects.filter(similar_id__in=product_ids).values_list("product_id", flat=True))
+
+
+# Actualización incremental tras cambiar (o comprar) `product_ids`: se
+# recalculan esos productos, los que ya los listaban y sus nuevos similares
+# (el puntaje es simétrico, así que probablemente ahora los incluyan).
+def refresh_similar_products(product_ids):
+    product_ids = set(product_ids)
+    previous = listing_products(product_ids)
+    rebuild_in_batches(product_ids)
+    current = set(SimilarProduct.objects.filter(product_id__in=product_ids).values_list("similar_id", flat=True))
+    rebuild_in_batches((previous | current) - product_ids)
@@ -0,0 +1,93 @@
+import re
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+
+# Bases consultadas por cada SELECT al asignar slugs en lote
+LOOKUP_CHUNK_SIZE = 200
+# Reintentos de save() cuando otra petición ocupa el slug entre la consulta y el INSERT
+SAVE_RETRIES = 5
+# Espacio reservado para el sufijo "-<número>" dentro de max_length
+SUFFIX_LENGTH = 11
+
+
+def slug_base(model, name):
+    max_length = model._meta.get_field("slug").max_length
+    base = slugify(name)[:max_length - SUFFIX_LENGTH].strip("-")
+    return base or model._meta.model_name
+
+
+# Slugs ocupados que son la base o la base con sufijo. Se usa un rango
+# (base-, base.) en lugar de LIKE para aprovechar el índice único en cualquier motor.
+def existing_slugs(model, bases):
+    bases = list(bases)
+    taken = set()
+    for start in range(0, len(bases), LOOKUP_CHUNK_SIZE):
+        condition = Q()
+        for base in bases[start:start + LOOKUP_CHUNK_SIZE]:
+            condition |= Q(slug=base) | Q(slug__gt=f"{base}-", slug__lt=f"{base}.")
+        taken.update(model.objects.filter(condition).values_list("slug", flat=True))
+    return taken
+
+
+# Devuelve un slug único por cada nombre, en el mismo orden, con una consulta
+# por cada LOOKUP_CHUNK_SIZE bases distintas. Los nombres repetidos dentro del
+# lote reciben sufijos consecutivos: "taza", "taza-1", "taza-2"...
+def allocate_slugs(model, names):
+    bases = [slug_base(model, name) for name in names]
+    distinct = set(bases)
+    taken = existing_slugs(model, distinct)
+
+    # Siguiente sufijo libre de cada base según el mayor sufijo ocupado
+    next_suffix = {}
+    for slug in taken:
+        if slug in distinct:
+            next_suffix[slug] = max(next_suffix.get(slug, 0), 1)
+        match = re.fullmatch(r"(.+)-(\d+)", slug)
+        if match and match.group(1) in distinct:
+            base, suffix = match.group(1), int(match.group(2))
+            next_suffix[base] = max(next_suffix.get(base, 0), suffix + 1)
+
+    slugs = []
+    for base in bases:
+        suffix = next_suffix.get(base, 0)
+        slug = f"{base}-{suffix}" if suffix else base
+        # Una base del lote puede parecer otra base con sufijo ("taza-2")
+        while slug in taken:
+            suffix += 1
+            slug = f"{base}-{suffix}"
+        taken.add(slug)
+        slugs.append(slug)
+        next_suffix[base] = suffix + 1
+    return slugs
+
+
+# Asigna slug a los objetos (sin guardar) que no lo tienen, p. ej. antes de bulk_create
+def assign_slugs(objects):
+    by_model = defaultdict(list)
+    for obj in objects:
+        if not obj.slug:
+            by_model[type(obj)].append(obj)
+    for model, pending in by_model.items():
+        for obj, slug in zip(pending, allocate_slugs(model, [obj.name for obj in pending])):
+            obj.slug = slug
+    return objects
+
+
+# Guarda la instancia con un slug generado. Si una petición concurrente toma el
+# mismo slug, el índice único rechaza el INSERT y se asigna el siguiente libre.
+def save_with_unique_slug(instance, save, *args, **kwargs):
+    model = type(instance)
+    for attempt in range(SAVE_RETRIES):
+        instance.slug = allocate_slugs(model, [instance.name])[0]
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            taken = model.objects.filter(slug=instance.slug).exclude(pk=instance.pk).exists()
+            if attempt == SAVE_RETRIES - 1 or not taken:
+                instance.slug = ""
+                raise
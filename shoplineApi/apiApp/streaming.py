@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+
+
+FORMATS = ("csv", "jsonl")
+CONTENT_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def detect_format(filename, default="csv"):
+    return "jsonl" if filename.endswith((".jsonl", ".ndjson", ".json")) else default
+
+
+# Lee filas (dicts) de un archivo de texto CSV o JSONL una a una, sin cargarlo en
+# memoria. Un archivo mal formado lanza ValueError con el número de línea; las
+# filas anteriores ya se entregaron.
+def read_rows(file, fmt):
+    if fmt == "csv":
+        reader = csv.DictReader(file)
+        try:
+            yield from reader
+        except csv.Error as error:
+            raise ValueError(f"Línea {reader.line_num}: CSV inválido ({error})") from error
+        return
+
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            raise ValueError(f"Línea {number}: JSON inválido ({error})") from error
+        if not isinstance(row, dict):
+            raise ValueError(f"Línea {number}: se esperaba un objeto JSON")
+        yield row
+
+
+# Convierte filas (dicts) en líneas de texto CSV o JSONL para escribirlas en un
+# archivo o enviarlas en una StreamingHttpResponse.
+def encode_rows(rows, fields, fmt):
+    if fmt == "jsonl":
+        for row in rows:
+            yield json.dumps({field: row[field] for field in fields}, default=str, ensure_ascii=False) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writeheader()
+    yield flush()
+    for row in rows:
+        writer.writerow(row)
+        yield flush()
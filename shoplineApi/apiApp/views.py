@@ -1,50 +1,131 @@
+import json
+from datetime import datetime, time, timedelta
+
 import stripe 
 from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth import get_user_model
-from django.db.models import Q
-from rest_framework.decorators import api_view
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Prefetch, Sum
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Cart, CartItem, Category, CustomerAddress, Order, OrderItem, Product, Review, Wishlist
-from .serializers import CartItemSerializer, CartSerializer, CategoryDetailSerializer, CategoryListSerializer, CustomerAddressSerializer, OrderSerializer, ProductListSerializer, ProductDetailSerializer, ReviewSerializer, SimpleCartSerializer, UserSerializer, WishlistSerializer
-
-
-from django.http import HttpResponse
+from .models import Cart, CartItem, Category, CustomerAddress, Order, OrderItem, Product, ProductRating, Review, Wishlist
+from .serializers import CartItemSerializer, CartSerializer, CategoryDetailSerializer, CategoryListSerializer, CustomerAddressSerializer, OrderSerializer, OrderSummarySerializer, ProductListSerializer, ProductDetailSerializer, ReviewSerializer, SimpleCartSerializer, UserSerializer, WishlistSerializer
+from .pagination import CatalogCursorPagination, paginated_list_response
+from .search import ranked_products
+from .caching import CATALOG_VERSION, CATEGORIES_VERSION, cache_catalog_response, cache_stats, product_version
+from .webhooks import FULFILLMENT_EVENTS, enqueue_event
+from .payments import checkout_items, checkout_session_params, configure_stripe
+from .conditional import category_list_etag, conditional_cart, conditional_catalog, product_etag
+from .order_export import ORDER_FIELDS, export_order_rows, orders_in_range
+from .streaming import CONTENT_TYPES, FORMATS, encode_rows
+from .instrumentation import endpoint_metrics
+from .membership import cart_product_ids, parse_product_ids, wishlist_product_ids, with_membership_flags
+from .facets import CATEGORY_FACETS, SEARCH_FACETS, FacetedProducts, with_facets
+
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 
 # Create your views here.
-stripe.api_key = settings.STRIPE_SECRET_KEY
+configure_stripe()
 endpoint_secret = settings.WEBHOOK_SECRET
 
 
 User = get_user_model()
 
+# Servido por el índice (featured, id): filtro y orden del cursor sin ordenar en memoria
+def featured_products():
+    return Product.objects.filter(featured=True)
+
+
 @api_view(['GET'])
+@with_membership_flags()
+@cache_catalog_response("product_list")
 def product_list(request):
-    products = Product.objects.filter(featured=True)
-    serializer = ProductListSerializer(products, many=True)
-    return Response(serializer.data)
+    products = featured_products()
+    return paginated_list_response(request, products, ProductListSerializer)
+
 
+# Carga el producto con su valoración (que incluye el histograma de estrellas)
+# y las reseñas con sus usuarios en un número fijo de consultas.
+def product_detail_queryset():
+    reviews = Review.objects.select_related("user")
+    return (Product.objects.select_related("rating")
+            .prefetch_related(Prefetch("reviews", queryset=reviews)))
 
+
+@conditional_catalog(product_etag)
 @api_view(["GET"])
+@cache_catalog_response("product_detail", lambda slug: [CATALOG_VERSION, product_version(slug)])
 def product_detail(request, slug):
-    product = Product.objects.get(slug=slug)
+    product = product_detail_queryset().get(slug=slug)
     serializer = ProductDetailSerializer(product)
     return Response(serializer.data)
 
 
+# "Los clientes también compraron": el top-K precalculado por
+# build_recommendations, leído con una consulta por el índice (product, rank).
+# Solo una lista vacía requiere comprobar que el producto exista.
+@api_view(["GET"])
+@with_membership_flags()
+@cache_catalog_response("also_bought", lambda slug: [CATALOG_VERSION, product_version(slug)])
+def also_bought(request, slug):
+    products = list(Product.objects.filter(recommended_for__product__slug=slug)
+                    .order_by("recommended_for__rank"))
+    if not products and not Product.objects.filter(slug=slug).exists():
+        return Response({"error": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
+    serializer = ProductListSerializer(products, many=True)
+    return Response(serializer.data)
+
+
+@conditional_catalog(category_list_etag)
 @api_view(["GET"])
+@cache_catalog_response("category_list", lambda: [CATALOG_VERSION, CATEGORIES_VERSION])
 def category_list(request):
-    categories = Category.objects.all()
+    categories = Category.objects.select_related("stats")
     serializer = CategoryListSerializer(categories, many=True)
     return Response(serializer.data)
 
+# Acepta los filtros y el orden de facets.py. El caché depende también de las
+# estadísticas de categorías: las reseñas cambian el filtro y el orden por calificación.
 @api_view(["GET"])
+@with_membership_flags("products")
+@cache_catalog_response("category_detail", lambda slug: [CATALOG_VERSION, CATEGORIES_VERSION])
 def category_detail(request, slug):
     category = Category.objects.get(slug=slug)
-    serializer = CategoryDetailSerializer(category)
-    return Response(serializer.data)
+    try:
+        listing = FacetedProducts(category.products.all(), request.query_params, CATEGORY_FACETS)
+    except ValueError as error:
+        return Response({"error": str(error)}, status=400)
+    paginator = CatalogCursorPagination(listing.ordering)
+    products = paginator.paginate_queryset(listing.products, request)
+    data = CategoryDetailSerializer(category, context={"products": products}).data
+    if listing.with_counts:
+        data = {**data, "facets": listing.counts()}
+    if paginator.legacy:
+        return paginator.get_list_response(data)
+    return Response({**data, **paginator.get_links()})
+
+
+# Carritos con sus totales calculados en SQL y los ítems (con su producto)
+# en una sola consulta adicional, sin importar la cantidad de ítems.
+def cart_queryset():
+    items = (CartItem.objects.select_related("product")
+             .annotate(sub_total=ExpressionWrapper(F("quantity") * F("product__price"),
+                                                   output_field=DecimalField(max_digits=12, decimal_places=2))))
+    return (Cart.objects.prefetch_related(Prefetch("cartitems", queryset=items))
+            .annotate(cart_total=Sum(F("cartitems__quantity") * F("cartitems__product__price"),
+                                     output_field=DecimalField(max_digits=12, decimal_places=2)),
+                      num_of_items=Sum("cartitems__quantity")))
+
+
+def cart_stat_queryset():
+    return Cart.objects.annotate(num_of_items=Sum("cartitems__quantity"))
 
 
 @api_view(["POST"])
@@ -59,7 +140,7 @@ def add_to_cart(request):
     cartitem.quantity = 1 
     cartitem.save() 
 
-    serializer = CartSerializer(cart)
+    serializer = CartSerializer(cart_queryset().get(id=cart.id))
     return Response(serializer.data)
 
 
@@ -70,7 +151,7 @@ def update_cartitem_quantity(request):
 
     quantity = int(quantity)
 
-    cartitem = CartItem.objects.get(id=cartitem_id)
+    cartitem = CartItem.objects.select_related("product").get(id=cartitem_id)
     cartitem.quantity = quantity 
     cartitem.save()
 
@@ -79,34 +160,60 @@ def update_cartitem_quantity(request):
 
 
 
+# Calificación entera de 1 a 5 (Review.RATING_CHOICES) o None si no es válida:
+# las señales de valoración solo tienen contadores para esas estrellas
+def parse_rating(value):
+    try:
+        rating = int(value)
+    except (TypeError, ValueError):
+        return None
+    return rating if rating in ProductRating.STAR_FIELDS else None
+
+
 @api_view(["POST"])
 def add_review(request):
     
     product_id = request.data.get("product_id")
     email = request.data.get("email")
-    rating = request.data.get("rating")
+    rating = parse_rating(request.data.get("rating"))
     review_text = request.data.get("review")
 
+    if rating is None:
+        return Response({"error": "rating must be an integer between 1 and 5"}, status=400)
+
     product = Product.objects.get(id=product_id)
     user = User.objects.get(email=email)
 
     if Review.objects.filter(product=product, user=user).exists():
         return Response({"error": "You already dropped a review for this product"}, status=400)
 
-    review  = Review.objects.create(product=product, user=user, rating=rating, review=review_text)
+    # La reseña y la actualización de la valoración (señales) se confirman
+    # juntas; una reseña simultánea del mismo usuario choca con unique_together
+    try:
+        with transaction.atomic():
+            review = Review.objects.create(product=product, user=user, rating=rating, review=review_text)
+    except IntegrityError:
+        return Response({"error": "You already dropped a review for this product"}, status=400)
     serializer = ReviewSerializer(review)
     return Response(serializer.data)
 
 
+# Las señales de Review aplican a la valoración el delta entre la calificación
+# leída y la nueva: la fila se bloquea (select_for_update) hasta confirmar, así
+# una edición concurrente espera y lee la calificación ya guardada.
 @api_view(['PUT'])
 def update_review(request, pk):
-    review = Review.objects.get(id=pk) 
-    rating = request.data.get("rating")
+    rating = parse_rating(request.data.get("rating"))
     review_text = request.data.get("review")
 
-    review.rating = rating 
-    review.review = review_text
-    review.save()
+    if rating is None:
+        return Response({"error": "rating must be an integer between 1 and 5"}, status=400)
+
+    with transaction.atomic():
+        review = Review.objects.select_for_update().get(id=pk)
+        review.rating = rating
+        review.review = review_text
+        review.save()
 
     serializer = ReviewSerializer(review)
     return Response(serializer.data)
@@ -114,8 +221,9 @@ def update_review(request, pk):
 
 @api_view(['DELETE'])
 def delete_review(request, pk):
-    review = Review.objects.get(id=pk) 
-    review.delete()
+    with transaction.atomic():
+        review = Review.objects.select_for_update().get(id=pk)
+        review.delete()
 
     return Response("Review deleted successfully!", status=200)
 
@@ -126,6 +234,75 @@ def delete_cartitem(request, pk):
     return Response({"message": "Cartitem deleted successfully!"}, status=200)
 
 
+# Aplica varias operaciones sobre el carrito en una sola petición y transacción.
+# Body: {"cart_code": "...", "operations": [{"action": "add" | "update" | "delete",
+#        "product_id": 1, "quantity": 2}, ...]}. Las operaciones se reducen al
+# estado final de cada producto y se escriben con bulk_create/bulk_update/delete.
+CART_BATCH_ACTIONS = ("add", "update", "delete")
+
+
+@api_view(["POST"])
+def batch_update_cart(request):
+    cart_code = request.data.get("cart_code")
+    operations = request.data.get("operations")
+
+    if not cart_code or not isinstance(operations, list):
+        return Response({"error": "cart_code and a list of operations are required"}, status=400)
+
+    # product_id -> cantidad final (None = eliminar)
+    final_quantities = {}
+    for operation in operations:
+        if not isinstance(operation, dict):
+            return Response({"error": "each operation must be an object"}, status=400)
+        action = operation.get("action")
+        if action not in CART_BATCH_ACTIONS:
+            return Response({"error": f"Invalid action: {action}"}, status=400)
+        try:
+            product_id = int(operation.get("product_id"))
+            quantity = None if action == "delete" else int(operation.get("quantity", 1))
+        except (TypeError, ValueError):
+            return Response({"error": "product_id and quantity must be integers"}, status=400)
+        if quantity is not None and quantity < 1:
+            return Response({"error": "quantity must be at least 1"}, status=400)
+        final_quantities[product_id] = quantity
+
+    # El carrito queda bloqueado hasta confirmar: dos lotes simultáneos sobre el
+    # mismo carrito se aplican uno después del otro y el segundo ve los ítems
+    # que creó el primero (si no, ambos crearían el mismo producto).
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(cart_code=cart_code)
+        cart = Cart.objects.select_for_update().get(id=cart.id)
+        existing = {item.product_id: item
+                    for item in CartItem.objects.filter(cart=cart, product_id__in=final_quantities)}
+        new_product_ids = {product_id for product_id, quantity in final_quantities.items()
+                           if quantity is not None and product_id not in existing}
+        found = set(Product.objects.filter(id__in=new_product_ids).values_list("id", flat=True))
+        if new_product_ids - found:
+            transaction.set_rollback(True)
+            return Response({"error": f"Products not found: {sorted(new_product_ids - found)}"}, status=400)
+
+        to_create, to_update, to_delete = [], [], []
+        for product_id, quantity in final_quantities.items():
+            item = existing.get(product_id)
+            if quantity is None:
+                if item:
+                    to_delete.append(item.id)
+            elif item is None:
+                to_create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+            elif item.quantity != quantity:
+                item.quantity = quantity
+                to_update.append(item)
+
+        CartItem.objects.bulk_create(to_create)
+        CartItem.objects.bulk_update(to_update, ["quantity"])
+        CartItem.objects.filter(id__in=to_delete).delete()
+        # Las operaciones masivas no emiten señales: se actualiza updated_at a mano
+        cart.save(update_fields=["updated_at"])
+
+    serializer = CartSerializer(cart_queryset().get(id=cart.id))
+    return Response(serializer.data)
+
+
 
 @api_view(['POST'])
 def add_to_wishlist(request):
@@ -140,21 +317,31 @@ def add_to_wishlist(request):
         wishlist.delete()
         return Response({"message": "Wishlist deleted successfully", "action": "deleted"}, status=200)
 
-    new_wishlist = Wishlist.objects.create(user=user, product=product)
+    try:
+        with transaction.atomic():
+            new_wishlist = Wishlist.objects.create(user=user, product=product)
+    except IntegrityError:
+        # Una petición concurrente lo agregó después de la consulta anterior
+        new_wishlist = Wishlist.objects.get(user=user, product=product)
     serializer = WishlistSerializer(new_wishlist)
     return Response({"wishlist": serializer.data, "action": "created"}, status=201)
 
 @api_view(['GET'])
+@with_membership_flags()
 def product_search(request):
     query = request.query_params.get("query") 
     if not query:
         return Response("No query provided", status=400)
     
-    products = Product.objects.filter(Q(name__icontains=query) | 
-                                      Q(description__icontains=query) |
-                                       Q(category__name__icontains=query) )
-    serializer = ProductListSerializer(products, many=True)
-    return Response(serializer.data)
+    try:
+        listing = FacetedProducts(ranked_products(query, settings.SEARCH_RESULTS_LIMIT), request.query_params,
+                                  SEARCH_FACETS, default_ordering="relevance")
+    except ValueError as error:
+        return Response({"error": str(error)}, status=400)
+    response = paginated_list_response(request, listing.products, ProductListSerializer, listing.ordering)
+    if listing.with_counts:
+        response.data = with_facets(response.data, listing.counts())
+    return response
     
 
 
@@ -168,54 +355,8 @@ def create_checkout_session(request):
     email = request.data.get("email")
     cart = Cart.objects.get(cart_code=cart_code)
     try:
-        checkout_session = stripe.checkout.Session.create(
-            customer_email= email,
-            payment_method_types=['card'],
-
-
-            line_items=[
-                {
-                    'price_data': {
-                        'currency': 'usd',
-                        'product_data': {'name': item.product.name},
-                        'unit_amount': int(item.product.price * 100),  # Amount in cents
-                    },
-                    'quantity': item.quantity,
-                }
-                for item in cart.cartitems.all()
-            ] + [
-                {
-                    'price_data': {
-                        'currency': 'usd',
-                        'product_data': {'name': 'VAT Fee'},
-                        'unit_amount': 500,  # $5 in cents
-                    },
-                    'quantity': 1,
-                }
-            ],
-
-
-            
-            # line_items=[
-            #     {
-            #         'price_data': {
-            #             'currency': 'usd',
-            #             'product_data': {'name': item.product.name},
-            #             'unit_amount': int(item.product.price) * 100,  # Amount in cents ($10)
-            #         },
-            #         'quantity': item.quantity,
-            #     }
-
-            #     for item in cart.cartitems.all()
-            # ],
-            mode='payment',
-            # success_url="https://nextshoppit.vercel.app/success",
-            # cancel_url="https://nextshoppit.vercel.app/cancel",
-
-            success_url="http://localhost:3000/success",
-            cancel_url="http://localhost:3000/failed",
-            metadata = {"cart_code": cart_code}
-        )
+        params = checkout_session_params(cart_code, email, checkout_items(cart))
+        checkout_session = stripe.checkout.Session.create(**params)
         return Response({'data': checkout_session})
     except Exception as e:
         return Response({'error': str(e)}, status=400)
@@ -240,43 +381,15 @@ def my_webhook_view(request):
     # Invalid signature
     return HttpResponse(status=400)
 
-  if (
-    event['type'] == 'checkout.session.completed'
-    or event['type'] == 'checkout.session.async_payment_succeeded'
-  ):
-    session = event['data']['object']
-    cart_code = session.get("metadata", {}).get("cart_code")
-
-    fulfill_checkout(session, cart_code)
-
+  # Solo se guarda el evento verificado; el comando process_webhooks lo
+  # procesa fuera de la petición y Stripe recibe la respuesta de inmediato.
+  if event['type'] in FULFILLMENT_EVENTS:
+    enqueue_event(json.loads(payload))
 
   return HttpResponse(status=200)
 
 
 
-def fulfill_checkout(session, cart_code):
-    
-    order = Order.objects.create(stripe_checkout_id=session["id"],
-        amount=session["amount_total"],
-        currency=session["currency"],
-        customer_email=session["customer_email"],
-        status="Paid")
-    
-
-    print(session)
-
-
-    cart = Cart.objects.get(cart_code=cart_code)
-    cartitems = cart.cartitems.all()
-
-    for item in cartitems:
-        orderitem = OrderItem.objects.create(order=order, product=item.product, 
-                                             quantity=item.quantity)
-    
-    cart.delete()
-
-
-
 
 # Newly Added
 
@@ -304,12 +417,21 @@ def existing_user(request, email):
         return Response({"exists": False}, status=status.HTTP_404_NOT_FOUND)
 
 
+# Con summary=true se omiten las líneas de cada orden (solo totales)
+def order_queryset(summary=False):
+    orders = Order.objects.annotate(item_count=Count("items"), total_quantity=Sum("items__quantity"))
+    if summary:
+        return orders
+    items = OrderItem.objects.select_related("product").order_by("id")
+    return orders.prefetch_related(Prefetch("items", queryset=items))
+
+
 @api_view(['GET'])
 def get_orders(request):
     email = request.query_params.get("email")
-    orders = Order.objects.filter(customer_email=email)
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    summary = request.query_params.get("summary", "").lower() in ("1", "true")
+    orders = order_queryset(summary).filter(customer_email=email)
+    return paginated_list_response(request, orders, OrderSummarySerializer if summary else OrderSerializer)
 
 
 @api_view(["POST"])
@@ -353,8 +475,7 @@ def get_address(request):
 def my_wishlists(request):
     email = request.query_params.get("email")
     wishlists = Wishlist.objects.filter(user__email=email)
-    serializer = WishlistSerializer(wishlists, many=True)
-    return Response(serializer.data)
+    return paginated_list_response(request, wishlists, WishlistSerializer)
 
 
 @api_view(["GET"])
@@ -367,10 +488,24 @@ def product_in_wishlist(request):
     return Response({"product_in_wishlist": False})
 
 
+# Pertenencia de varios productos (product_ids=1,2,3) en una sola consulta
+@api_view(["GET"])
+def wishlist_membership(request):
+    email = request.query_params.get("email")
+    try:
+        product_ids = parse_product_ids(request.query_params.get("product_ids"))
+    except ValueError as error:
+        return Response({"error": f"Invalid product_ids: {error}"}, status=400)
+
+    in_wishlist = wishlist_product_ids(email, product_ids)
+    return Response({"product_in_wishlist": {product_id: product_id in in_wishlist for product_id in product_ids}})
+
+
 
+@conditional_cart()
 @api_view(['GET'])
 def get_cart(request, cart_code):
-    cart = Cart.objects.filter(cart_code=cart_code).first()
+    cart = cart_queryset().filter(cart_code=cart_code).first()
     
     if cart:
         serializer = CartSerializer(cart)
@@ -381,10 +516,11 @@ def get_cart(request, cart_code):
 
 
 
+@conditional_cart(from_query=True)
 @api_view(['GET'])
 def get_cart_stat(request):
     cart_code = request.query_params.get("cart_code")
-    cart = Cart.objects.filter(cart_code=cart_code).first()
+    cart = cart_stat_queryset().filter(cart_code=cart_code).first()
 
     if cart:
         serializer = SimpleCartSerializer(cart)
@@ -403,3 +539,68 @@ def product_in_cart(request):
     product_exists_in_cart = CartItem.objects.filter(cart=cart, product=product).exists()
 
     return Response({'product_in_cart': product_exists_in_cart})
+
+
+@api_view(['GET'])
+def cart_membership(request):
+    cart_code = request.query_params.get("cart_code")
+    try:
+        product_ids = parse_product_ids(request.query_params.get("product_ids"))
+    except ValueError as error:
+        return Response({"error": f"Invalid product_ids: {error}"}, status=400)
+
+    in_cart = cart_product_ids(cart_code, product_ids)
+    return Response({"product_in_cart": {product_id: product_id in in_cart for product_id in product_ids}})
+
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def catalog_cache_stats(request):
+    return Response(cache_stats.snapshot())
+
+
+# Métricas por endpoint en formato de texto de Prometheus. Solo para
+# administradores: Prometheus puede autenticarse con basic_auth.
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    return HttpResponse(endpoint_metrics.prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+
+# Convierte "2025-01-31" o "2025-01-31T10:00" en un datetime con zona horaria.
+# Una fecha sin hora como límite final incluye el día completo.
+def parse_export_date(value, end=False):
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(value)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+# Exportación contable de las líneas de orden (CSV o JSONL) en streaming
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_orders(request):
+    output = request.query_params.get("output", "csv")
+    if output not in FORMATS:
+        return Response({"error": f"output must be one of {', '.join(FORMATS)}"}, status=400)
+    try:
+        start = request.query_params.get("start")
+        end = request.query_params.get("end")
+        start = parse_export_date(start) if start else None
+        end = parse_export_date(end, end=True) if end else None
+    except ValueError as error:
+        return Response({"error": f"Invalid date: {error}"}, status=400)
+
+    orders = orders_in_range(start, end, request.query_params.get("status"))
+    response = StreamingHttpResponse(encode_rows(export_order_rows(orders), ORDER_FIELDS, output),
+                                     content_type=CONTENT_TYPES[output])
+    response["Content-Disposition"] = f'attachment; filename="orders.{output}"'
+    return response
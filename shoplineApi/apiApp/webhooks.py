@@ -0,0 +1,106 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Cart, Order, OrderItem, WebhookEvent
+from .similarity import refresh_similar_products
+
+
+# Eventos de Stripe que crean una orden
+FULFILLMENT_EVENTS = ("checkout.session.completed", "checkout.session.async_payment_succeeded")
+
+
+# Crea la orden de una sesión de Stripe pagada. Es idempotente por
+# stripe_checkout_id: si Stripe reenvía el evento, la orden ya existe y no se
+# hace nada más. Todo ocurre en una transacción. Si otro worker crea la misma
+# orden al mismo tiempo, el índice único rechaza el INSERT y se devuelve la
+# suya, leída fuera de la transacción revertida (en MySQL, REPEATABLE READ no
+# la vería dentro de ella).
+def fulfill_checkout(session, cart_code):
+    try:
+        with transaction.atomic():
+            order, created = Order.objects.get_or_create(stripe_checkout_id=session["id"], defaults={
+                "amount": session["amount_total"],
+                "currency": session["currency"],
+                "customer_email": session["customer_email"],
+                "status": "Paid",
+            })
+            if not created:
+                return order
+
+            cart = Cart.objects.filter(cart_code=cart_code).first()
+            if cart:
+                items = OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product_id=item.product_id, quantity=item.quantity)
+                    for item in cart.cartitems.all()
+                ])
+                cart.delete()
+                # Las compras conjuntas cambian los productos similares
+                product_ids = [item.product_id for item in items]
+                if len(product_ids) > 1:
+                    transaction.on_commit(lambda: refresh_similar_products(product_ids))
+    except IntegrityError:
+        return Order.objects.get(stripe_checkout_id=session["id"])
+
+    return order
+
+
+# ----------------------- COLA -----------------------
+
+# Guarda un evento verificado. Los reenvíos de Stripe (mismo id) se ignoran.
+def enqueue_event(event):
+    webhook_event, created = WebhookEvent.objects.get_or_create(event_id=event["id"], defaults={
+        "event_type": event["type"],
+        "payload": event,
+    })
+    return webhook_event
+
+
+def handle_event(event):
+    if event["type"] in FULFILLMENT_EVENTS:
+        session = event["data"]["object"]
+        cart_code = (session.get("metadata") or {}).get("cart_code")
+        fulfill_checkout(session, cart_code)
+
+
+# Reserva hasta `limit` eventos listos para procesar. Los eventos en
+# "Processing" de un worker caído se recuperan pasados `stale_after` segundos.
+# En MySQL, SKIP LOCKED permite varios workers en paralelo sin bloquearse.
+def claim_events(limit, stale_after):
+    now = timezone.now()
+    ready = (Q(status=WebhookEvent.PENDING, next_attempt_at__lte=now)
+             | Q(status=WebhookEvent.PROCESSING, updated_at__lte=now - timedelta(seconds=stale_after)))
+    with transaction.atomic():
+        event_ids = list(WebhookEvent.objects.select_for_update(skip_locked=True)
+                         .filter(ready).order_by("next_attempt_at")
+                         .values_list("id", flat=True)[:limit])
+        WebhookEvent.objects.filter(id__in=event_ids).update(status=WebhookEvent.PROCESSING, updated_at=now)
+    return event_ids
+
+
+# Procesa un evento reservado. Si falla se reintenta con espera exponencial
+# (backoff * 2^intentos) hasta `max_attempts`; después queda en "Dead".
+def process_event(event_id, max_attempts, backoff):
+    try:
+        event = WebhookEvent.objects.get(id=event_id)
+        try:
+            handle_event(event.payload)
+        except Exception as error:
+            attempts = event.attempts + 1
+            WebhookEvent.objects.filter(id=event_id).update(
+                status=WebhookEvent.DEAD if attempts >= max_attempts else WebhookEvent.PENDING,
+                attempts=attempts,
+                last_error=repr(error),
+                next_attempt_at=timezone.now() + timedelta(seconds=backoff * 2 ** (attempts - 1)),
+                updated_at=timezone.now(),
+            )
+            return False
+
+        WebhookEvent.objects.filter(id=event_id).update(status=WebhookEvent.DONE, attempts=F("attempts") + 1,
+                                                        last_error="", updated_at=timezone.now())
+        return True
+    finally:
+        # Cada hilo del worker usa su propia conexión
+        close_old_connections()
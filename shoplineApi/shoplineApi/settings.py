@@ -53,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apiApp.instrumentation.PerformanceMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -158,4 +159,53 @@ AUTH_USER_MODEL = "apiApp.CustomUser"
 
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
 STRIPE_PUBLIC_KEY = os.environ.get("STRIPE_PUBLIC_KEY")
-WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
\ No newline at end of file
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+
+# Paginación por cursor de los listados: tamaño por defecto y máximo por página
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", 20))
+API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", 100))
+
+# Búsqueda de productos: backend (por defecto según el motor de base de datos)
+# y número máximo de resultados ordenados por relevancia
+PRODUCT_SEARCH_BACKEND = os.environ.get("PRODUCT_SEARCH_BACKEND")
+SEARCH_RESULTS_LIMIT = int(os.environ.get("SEARCH_RESULTS_LIMIT", 200))
+
+# Caché de las respuestas del catálogo. "default" es el caché compartido entre
+# procesos y guarda también las versiones que invalidan las respuestas. Por
+# defecto es LocMemCache, que es local de cada proceso: con varios workers
+# (gunicorn) un cambio solo invalida el caché del proceso que lo hizo y los
+# demás sirven respuestas viejas hasta CATALOG_CACHE_TIMEOUT. En producción
+# CACHE_BACKEND/CACHE_LOCATION deben apuntar a un caché compartido, p. ej.
+# PyMemcacheCache, RedisCache o DatabaseCache (tras "manage.py createcachetable").
+# "catalog_local" es un primer nivel en memoria de cada proceso.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "shopline"),
+    },
+    "catalog_local": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "shopline-catalog-local",
+    },
+}
+CATALOG_CACHE = "default"
+CATALOG_LOCAL_CACHE = "catalog_local"
+CATALOG_CACHE_TIMEOUT = int(os.environ.get("CATALOG_CACHE_TIMEOUT", 300))
+CATALOG_LOCAL_CACHE_TIMEOUT = int(os.environ.get("CATALOG_LOCAL_CACHE_TIMEOUT", 30))
+
+# Segundos que el navegador puede reutilizar las respuestas del catálogo antes
+# de revalidarlas con su ETag
+CATALOG_CACHE_MAX_AGE = int(os.environ.get("CATALOG_CACHE_MAX_AGE", 60))
+
+# Cliente HTTP de Stripe: URL base (permite apuntar a un servidor de pruebas
+# local), timeout en segundos y reintentos de red
+STRIPE_API_BASE = os.environ.get("STRIPE_API_BASE", "https://api.stripe.com")
+STRIPE_TIMEOUT = float(os.environ.get("STRIPE_TIMEOUT", 10))
+STRIPE_MAX_NETWORK_RETRIES = int(os.environ.get("STRIPE_MAX_NETWORK_RETRIES", 2))
+
+# Días sin actividad (Cart.updated_at) tras los que purge_carts elimina un carrito
+CART_TTL_DAYS = int(os.environ.get("CART_TTL_DAYS", 30))
+
+# Peticiones que superan este tiempo (ms) se registran en el logger
+# "apiApp.performance" con sus consultas SQL más repetidas
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", 500))